@@ -0,0 +1,86 @@
+import libtcodpy as libtcod
+import math
+
+##################################
+# Effect animations
+##################################
+#
+#Effects are only for show: the game resolves an action straight away, then queues
+#the effect that illustrates it and carries on. The scheduler plays effects out over
+#the following frames, by the time elapsed since each one started, so nothing ever
+#waits for an animation to finish.
+#
+#An effect has a duration and a cells(age) method, listing the (x, y, char, color)
+#cells it covers age milliseconds after it started, in map coordinates.
+
+class ExplosionRing:
+    #A ring growing from (x, y) out to radius, cooling from yellow to red as it goes
+    def __init__(self, x, y, radius, duration=400):
+        self.x = x
+        self.y = y
+        self.radius = radius
+        self.duration = duration
+
+    def cells(self, age):
+        progress = float(age) / self.duration
+        ring = self.radius * progress
+        color = libtcod.color_lerp(libtcod.yellow, libtcod.red, progress)
+        cells = []
+        for dy in range(-self.radius, self.radius + 1):
+            for dx in range(-self.radius, self.radius + 1):
+                if abs(math.sqrt(dx ** 2 + dy ** 2) - ring) < 0.5:
+                    cells.append((self.x + dx, self.y + dy, '*', color))
+        return cells
+
+class ProjectileTrail:
+    #Something flying along path (a list of cells), followed by a trail that fades out behind it
+    def __init__(self, path, char, color, step=25, trail=3):
+        self.path = path
+        self.char = char
+        self.color = color
+        self.step = step #Milliseconds spent on each cell
+        self.trail = trail
+        self.duration = (len(path) + trail) * step
+
+    def cells(self, age):
+        head = age // self.step
+        cells = []
+        for i in range(self.trail + 1):
+            if 0 <= head - i < len(self.path):
+                (x, y) = self.path[head - i]
+                if i == 0:
+                    cells.append((x, y, self.char, self.color))
+                else:
+                    cells.append((x, y, '.', self.color * (1.0 - float(i) / (self.trail + 1))))
+        return cells
+
+class HitFlash:
+    #The glyph of an object flashing white, then back to its own color, follows the object if it moves
+    def __init__(self, obj, duration=200):
+        self.obj = obj
+        self.duration = duration
+
+    def cells(self, age):
+        color = libtcod.color_lerp(libtcod.white, self.obj.color, float(age) / self.duration)
+        return [(self.obj.x, self.obj.y, self.obj.char, color)]
+
+class AnimationScheduler:
+    #Effects still playing, with the time they started at. clock returns the elapsed time
+    #in milliseconds, such as a backend's sys_elapsed_milli.
+    def __init__(self, clock):
+        self.clock = clock
+        self.playing = []
+
+    def add(self, effect):
+        self.playing.append((self.clock(), effect))
+
+    def clear(self):
+        self.playing = []
+
+    def draw(self, put):
+        #Forget the effects that are over, then call put(x, y, color, char) for each cell of the others
+        now = self.clock()
+        self.playing = [(start, effect) for (start, effect) in self.playing if now - start < effect.duration]
+        for (start, effect) in self.playing:
+            for (x, y, char, color) in effect.cells(now - start):
+                put(x, y, color, char)
@@ -0,0 +1,632 @@
+import libtcodpy as libtcod
+import os
+import select
+import sys
+import textwrap
+import time
+
+##################################
+# Render backends
+##################################
+#
+#The game draws through a backend object instead of calling libtcod's console
+#functions directly. Every backend offers the same console_* methods, with the
+#same arguments as the libtcod functions of the same name, so rogue.py doesn't
+#care whether frames end up in an SDL window or in memory.
+#
+#A console is whatever console_new returns, 0 always means the root console.
+
+#What the CP437 font shows for codes 1 to 31 and 127. Python's cp437 codec decodes these
+#bytes to control characters, which terminals don't draw (nor move the cursor over).
+CP437_CONTROL_GLYPHS = {
+        1: u'\u263a', 2: u'\u263b', 3: u'\u2665', 4: u'\u2666', 5: u'\u2663', 6: u'\u2660', 7: u'\u2022',
+        8: u'\u25d8', 9: u'\u25cb', 10: u'\u25d9', 11: u'\u2642', 12: u'\u2640', 13: u'\u266a', 14: u'\u266b',
+        15: u'\u263c', 16: u'\u25ba', 17: u'\u25c4', 18: u'\u2195', 19: u'\u203c', 20: u'\u00b6', 21: u'\u00a7',
+        22: u'\u25ac', 23: u'\u21a8', 24: u'\u2191', 25: u'\u2193', 26: u'\u2192', 27: u'\u2190', 28: u'\u221f',
+        29: u'\u2194', 30: u'\u25b2', 31: u'\u25bc', 127: u'\u2302'}
+
+class SDLBackend:
+    #Renders to the SDL window through libtcod
+
+    #SDL has to be drawn from the thread that opened the window, so frames are drawn inline.
+    #The game thread then waits for every frame as it did before snapshots: the render thread
+    #gains nothing here. Decoupling SDL would take the simulation moving to a worker thread
+    #instead, with input and drawing left on the main one.
+    render_thread = False
+
+    def init_root(self, width, height, title, font, fps):
+        libtcod.console_set_custom_font(font, libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
+        libtcod.console_init_root(width, height, title, False)
+        libtcod.sys_set_fps(fps)
+
+    def console_new(self, width, height):
+        return libtcod.console_new(width, height)
+
+    def console_delete(self, con):
+        libtcod.console_delete(con)
+
+    def console_clear(self, con):
+        libtcod.console_clear(con)
+
+    def console_set_default_background(self, con, color):
+        libtcod.console_set_default_background(con, color)
+
+    def console_set_default_foreground(self, con, color):
+        libtcod.console_set_default_foreground(con, color)
+
+    def console_put_char(self, con, x, y, c, flag=libtcod.BKGND_DEFAULT):
+        libtcod.console_put_char(con, x, y, c, flag)
+
+    def console_set_char_background(self, con, x, y, color, flag=libtcod.BKGND_SET):
+        libtcod.console_set_char_background(con, x, y, color, flag)
+
+    def console_rect(self, con, x, y, w, h, clear, flag=libtcod.BKGND_DEFAULT):
+        libtcod.console_rect(con, x, y, w, h, clear, flag)
+
+    def console_print_ex(self, con, x, y, flag, alignment, text):
+        libtcod.console_print_ex(con, x, y, flag, alignment, text)
+
+    def console_print_rect_ex(self, con, x, y, w, h, flag, alignment, text):
+        return libtcod.console_print_rect_ex(con, x, y, w, h, flag, alignment, text)
+
+    def console_get_height_rect(self, con, x, y, w, h, text):
+        return libtcod.console_get_height_rect(con, x, y, w, h, text)
+
+    def console_blit(self, src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+        libtcod.console_blit(src, x, y, w, h, dst, xdst, ydst, ffade, bfade)
+
+    def buffer_blit(self, buffer, con):
+        #Copy a whole ConsoleBuffer onto a console of the same size
+        buffer.blit(con)
+
+    def console_get_rect(self, con, x, y, w, h):
+        #Read a region of a console back into a new ConsoleBuffer
+        rect = libtcod.ConsoleBuffer(w, h)
+        for cy in range(h):
+            for cx in range(w):
+                fore = libtcod.console_get_char_foreground(con, x + cx, y + cy)
+                back = libtcod.console_get_char_background(con, x + cx, y + cy)
+                rect.set(cx, cy, back.r, back.g, back.b, fore.r, fore.g, fore.b,
+                        libtcod.console_get_char(con, x + cx, y + cy))
+        return rect
+
+    def console_flush(self):
+        libtcod.console_flush()
+
+    def console_is_window_closed(self):
+        return libtcod.console_is_window_closed()
+
+    def console_is_fullscreen(self):
+        return libtcod.console_is_fullscreen()
+
+    def console_set_fullscreen(self, fullscreen):
+        libtcod.console_set_fullscreen(fullscreen)
+
+    def console_wait_for_keypress(self, flush):
+        return libtcod.console_wait_for_keypress(flush)
+
+    def sys_check_for_event(self, mask, key, mouse):
+        return libtcod.sys_check_for_event(mask, key, mouse)
+
+    def sys_elapsed_milli(self):
+        return libtcod.sys_elapsed_milli()
+
+class HeadlessConsole:
+    #An in-memory console: a grid of characters and colors plus the console's drawing state
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.buffer = libtcod.ConsoleBuffer(width, height)
+        self.default_background = libtcod.Color(0, 0, 0)
+        self.default_foreground = libtcod.Color(255, 255, 255)
+
+    def in_bounds(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def get_char(self, x, y):
+        return self.buffer.char[self.width * y + x]
+
+    def get_foreground(self, x, y):
+        i = self.width * y + x
+        return (self.buffer.fore_r[i], self.buffer.fore_g[i], self.buffer.fore_b[i])
+
+    def get_background(self, x, y):
+        i = self.width * y + x
+        return (self.buffer.back_r[i], self.buffer.back_g[i], self.buffer.back_b[i])
+
+    def text(self):
+        #The characters on the console as a list of strings, one per row
+        return [''.join(chr(self.get_char(x, y)) if self.get_char(x, y) < 128 else '?'
+                for x in range(self.width)) for y in range(self.height)]
+
+class HeadlessBackend:
+    #Keeps every console in memory and never touches SDL, for servers, CI and simulations.
+    #Input comes from queued events, the window counts as closed once the queue runs dry.
+
+    #Frames are drawn inline, so runs (and the frame clock) are repeatable
+    render_thread = False
+
+    def __init__(self):
+        self.root = None
+        self.frames = 0
+        self.fps = 0
+        self.closed = False
+        self.fullscreen = False
+        self.events = []
+
+    def init_root(self, width, height, title, font, fps):
+        self.root = HeadlessConsole(width, height)
+        self.fps = fps
+
+    def console(self, con):
+        #Resolve a console handle, 0 being the root console
+        if con == 0:
+            return self.root
+        return con
+
+    ################
+    # Input
+    ################
+
+    def push_key(self, vk, c=0, lalt=False):
+        #Queue a key press, c is a character code (or a one-letter string, bytes or unicode) for KEY_CHAR keys
+        if not isinstance(c, int):
+            c = ord(c)
+        self.events.append(('key', vk, c, lalt))
+
+    def push_mouse(self, cx, cy, lbutton_pressed=False, rbutton_pressed=False):
+        #Queue a mouse event on the cell cx, cy
+        self.events.append(('mouse', cx, cy, lbutton_pressed, rbutton_pressed))
+
+    def next_event(self, key, mouse):
+        #Fill key and mouse with the next queued event, returns its libtcod event type
+        key.vk = libtcod.KEY_NONE
+        key.c = 0
+        key.lalt = False
+        mouse.lbutton_pressed = False
+        mouse.rbutton_pressed = False
+        if not self.events:
+            self.closed = True
+            return libtcod.EVENT_NONE
+
+        event = self.events.pop(0)
+        if event[0] == 'key':
+            (kind, key.vk, key.c, key.lalt) = event
+            key.pressed = True
+            return libtcod.EVENT_KEY_PRESS
+        (kind, mouse.cx, mouse.cy, mouse.lbutton_pressed, mouse.rbutton_pressed) = event
+        return libtcod.EVENT_MOUSE
+
+    def console_wait_for_keypress(self, flush):
+        key = libtcod.Key()
+        mouse = libtcod.Mouse()
+        while self.next_event(key, mouse) == libtcod.EVENT_MOUSE:
+            pass
+        if self.closed:
+            key.vk = libtcod.KEY_ESCAPE
+        return key
+
+    def sys_check_for_event(self, mask, key, mouse):
+        return self.next_event(key, mouse)
+
+    def sys_elapsed_milli(self):
+        #Time advances by one frame per flush at the target frame rate, so runs are repeatable
+        if self.fps <= 0:
+            return 0
+        return self.frames * 1000 // self.fps
+
+    ################
+    # Window
+    ################
+
+    def console_flush(self):
+        self.frames += 1
+
+    def console_is_window_closed(self):
+        return self.closed
+
+    def console_is_fullscreen(self):
+        return self.fullscreen
+
+    def console_set_fullscreen(self, fullscreen):
+        self.fullscreen = fullscreen
+
+    ################
+    # Drawing
+    ################
+
+    def console_new(self, width, height):
+        return HeadlessConsole(width, height)
+
+    def console_delete(self, con):
+        pass
+
+    def console_clear(self, con):
+        con = self.console(con)
+        back = con.default_background
+        fore = con.default_foreground
+        con.buffer.clear(back.r, back.g, back.b, fore.r, fore.g, fore.b, ' ')
+
+    def console_set_default_background(self, con, color):
+        self.console(con).default_background = color
+
+    def console_set_default_foreground(self, con, color):
+        self.console(con).default_foreground = color
+
+    def set_background(self, con, x, y, color, flag):
+        #Apply a background color to one cell the way libtcod's blending flags would
+        if flag == libtcod.BKGND_NONE or not con.in_bounds(x, y):
+            return
+        (r, g, b) = (color.r, color.g, color.b)
+        if flag == libtcod.BKGND_SCREEN:
+            (old_r, old_g, old_b) = con.get_background(x, y)
+            r = 255 - (255 - old_r) * (255 - r) // 255
+            g = 255 - (255 - old_g) * (255 - g) // 255
+            b = 255 - (255 - old_b) * (255 - b) // 255
+        con.buffer.set_back(x, y, r, g, b)
+
+    def console_put_char(self, con, x, y, c, flag=libtcod.BKGND_DEFAULT):
+        con = self.console(con)
+        if not con.in_bounds(x, y):
+            return
+        fore = con.default_foreground
+        con.buffer.set_fore(x, y, fore.r, fore.g, fore.b, c)
+        self.set_background(con, x, y, con.default_background, flag)
+
+    def console_set_char_background(self, con, x, y, color, flag=libtcod.BKGND_SET):
+        self.set_background(self.console(con), x, y, color, flag)
+
+    def console_rect(self, con, x, y, w, h, clear, flag=libtcod.BKGND_DEFAULT):
+        con = self.console(con)
+        for cy in range(y, y + h):
+            for cx in range(x, x + w):
+                if con.in_bounds(cx, cy):
+                    self.set_background(con, cx, cy, con.default_background, flag)
+                    if clear:
+                        con.buffer.set_char(cx, cy, ' ')
+
+    def print_line(self, con, x, y, flag, alignment, line):
+        if alignment == libtcod.CENTER:
+            x -= len(line) // 2
+        elif alignment == libtcod.RIGHT:
+            x -= len(line) - 1
+        fore = con.default_foreground
+        for c in line:
+            if con.in_bounds(x, y):
+                con.buffer.set_fore(x, y, fore.r, fore.g, fore.b, c)
+                self.set_background(con, x, y, con.default_background, flag)
+            x += 1
+
+    def wrap(self, text, w):
+        #Split text the way libtcod's *_rect functions do: on newlines, then on word boundaries
+        lines = []
+        for paragraph in text.split('\n'):
+            lines.extend(textwrap.wrap(paragraph, w) or [''])
+        return lines
+
+    def console_print_ex(self, con, x, y, flag, alignment, text):
+        con = self.console(con)
+        for line in text.split('\n'):
+            self.print_line(con, x, y, flag, alignment, line)
+            y += 1
+
+    def console_print_rect_ex(self, con, x, y, w, h, flag, alignment, text):
+        con = self.console(con)
+        lines = self.wrap(text, w)
+        if h > 0:
+            lines = lines[:h]
+        for line in lines:
+            self.print_line(con, x, y, flag, alignment, line)
+            y += 1
+        return len(lines)
+
+    def console_get_height_rect(self, con, x, y, w, h, text):
+        lines = len(self.wrap(text, w))
+        if h > 0:
+            return min(lines, h)
+        return lines
+
+    def console_blit(self, src, x, y, w, h, dst, xdst, ydst, ffade=1.0, bfade=1.0):
+        src = self.console(src)
+        dst = self.console(dst)
+        if w == 0:
+            w = src.width
+        if h == 0:
+            h = src.height
+        if ffade == 1.0 and bfade == 1.0:
+            #Plain copy, clipped to both consoles
+            w = min(w, src.width - x, dst.width - xdst)
+            h = min(h, src.height - y, dst.height - ydst)
+            if w > 0 and h > 0:
+                dst.buffer.set_rect(xdst, ydst, src.buffer.get_rect(x, y, w, h))
+            return
+
+        for cy in range(h):
+            for cx in range(w):
+                if src.in_bounds(x + cx, y + cy) and dst.in_bounds(xdst + cx, ydst + cy):
+                    self.blend_cell(src, x + cx, y + cy, dst, xdst + cx, ydst + cy, ffade, bfade)
+
+    def blend_cell(self, src, sx, sy, dst, dx, dy, ffade, bfade):
+        #Fade one source cell over a destination cell, following libtcod's blit rules
+        src_char = src.get_char(sx, sy)
+        dst_char = dst.get_char(dx, dy)
+        dst_back = dst.get_background(dx, dy)
+        back = lerp(dst_back, src.get_background(sx, sy), bfade)
+        if src_char == ord(' '):
+            fore = lerp(dst.get_foreground(dx, dy), src.get_background(sx, sy), bfade)
+            char = dst_char
+        elif dst_char == ord(' ') or dst_char == src_char:
+            fore = lerp(dst_back, src.get_foreground(sx, sy), ffade)
+            char = src_char
+        elif ffade < 0.5:
+            fore = lerp(dst.get_foreground(dx, dy), dst_back, ffade * 2)
+            char = dst_char
+        else:
+            fore = lerp(dst_back, src.get_foreground(sx, sy), (ffade - 0.5) * 2)
+            char = src_char
+        dst.buffer.set(dx, dy, back[0], back[1], back[2], fore[0], fore[1], fore[2], char)
+
+    def buffer_blit(self, buffer, con):
+        con = self.console(con)
+        if buffer.width != con.width or buffer.height != con.height:
+            raise ValueError('buffer_blit: Destination console has an incorrect size.')
+        con.buffer.set_rect(0, 0, buffer)
+
+    def console_get_rect(self, con, x, y, w, h):
+        return self.console(con).buffer.get_rect(x, y, w, h)
+
+class TerminalBackend(HeadlessBackend):
+    #Plays in a plain terminal (e.g. over SSH) using ANSI escape sequences. Frames are drawn
+    #in memory exactly like the headless backend, then only the cells that changed since the
+    #last flush are sent, at most max_frame_bytes per frame. Cells that don't fit stay dirty
+    #and go out with the next frame.
+
+    #Encoding and writing frames (and sleeping off the frame rate) happens on a render thread
+    render_thread = True
+
+    #Rewriting a few unchanged cells is cheaper than a cursor move, so runs closer than this are merged
+    MAX_RUN_GAP = 4
+
+    #Input sequences for the keys the game uses
+    KEY_SEQUENCES = {
+            '\x1b[A': libtcod.KEY_UP, '\x1b[B': libtcod.KEY_DOWN,
+            '\x1b[C': libtcod.KEY_RIGHT, '\x1b[D': libtcod.KEY_LEFT,
+            '\x1b': libtcod.KEY_ESCAPE, '\r': libtcod.KEY_ENTER, '\n': libtcod.KEY_ENTER}
+
+    def __init__(self, max_frame_bytes=16384, output=None, input=None):
+        HeadlessBackend.__init__(self)
+        self.max_frame_bytes = max_frame_bytes
+        self.output = output or sys.stdout
+        self.input = input or sys.stdin
+        self.previous = None
+        self.glyphs = {}
+        self.started = time.time()
+        self.last_flush = 0
+        self.saved_tty = None
+
+        #Bytes written by the last flush and since the session started
+        self.frame_bytes = 0
+        self.total_bytes = 0
+
+    def init_root(self, width, height, title, font, fps):
+        HeadlessBackend.init_root(self, width, height, title, font, fps)
+        self.started = time.time()
+
+        #Nothing has been drawn yet, so the previous frame can't match any cell
+        self.previous = libtcod.ConsoleBuffer(width, height, char=-1)
+
+        if self.input.isatty():
+            import atexit
+            import termios
+            import tty
+            self.saved_tty = termios.tcgetattr(self.input.fileno())
+            tty.setraw(self.input.fileno())
+            atexit.register(self.close)
+
+        #Alternate screen, hidden cursor, mouse reporting (SGR encoding), title
+        self.write(b'\x1b[?1049h\x1b[?25l\x1b[?1003h\x1b[?1006h\x1b[2J')
+        self.write(('\x1b]0;' + title + '\x07').encode('utf-8'))
+
+    def close(self):
+        #Give the terminal back in the state it was found
+        if self.saved_tty is not None:
+            import termios
+            self.write(b'\x1b[0m\x1b[?1006l\x1b[?1003l\x1b[?25h\x1b[?1049l')
+            termios.tcsetattr(self.input.fileno(), termios.TCSADRAIN, self.saved_tty)
+            self.saved_tty = None
+
+    def write(self, data):
+        stream = getattr(self.output, 'buffer', self.output)
+        stream.write(data)
+        self.output.flush()
+
+    ################
+    # Output
+    ################
+
+    def glyph(self, code):
+        #UTF-8 bytes for a libtcod character code, which follows the CP437 font layout
+        if code not in self.glyphs:
+            if 32 <= code < 127:
+                self.glyphs[code] = chr(code).encode('ascii')
+            elif code in CP437_CONTROL_GLYPHS:
+                self.glyphs[code] = CP437_CONTROL_GLYPHS[code].encode('utf-8')
+            elif 128 <= code < 256:
+                self.glyphs[code] = bytearray([code]).decode('cp437').encode('utf-8')
+            else:
+                self.glyphs[code] = b' '
+        return self.glyphs[code]
+
+    def changed_cells(self, y):
+        #Columns of row y that differ from the previous frame
+        current = self.root.buffer
+        previous = self.previous
+        width = self.root.width
+        i = width * y
+        planes = [(getattr(current, name), getattr(previous, name)) for name in libtcod.ConsoleBuffer._planes]
+        if all(rows_equal(cur, prev, i, width) for (cur, prev) in planes):
+            return []
+        return [x for x in range(width)
+                if any(cur[i + x] != prev[i + x] for (cur, prev) in planes)]
+
+    def runs(self, columns):
+        #Coalesce changed columns into (start, end) runs, bridging small unchanged gaps
+        runs = []
+        for x in columns:
+            if runs and x - runs[-1][1] <= self.MAX_RUN_GAP:
+                runs[-1][1] = x
+            else:
+                runs.append([x, x])
+        return runs
+
+    def render_frame(self):
+        #Build the escape sequences that turn the previous frame into the current one
+        current = self.root.buffer
+        previous = self.previous
+        width = self.root.width
+        out = []
+        size = 0
+        fore = back = None
+        for y in range(self.root.height):
+            for (start, end) in self.runs(self.changed_cells(y)):
+                move = ('\x1b[%d;%dH' % (y + 1, start + 1)).encode('ascii')
+                for x in range(start, end + 1):
+                    i = width * y + x
+                    cell = []
+                    if move:
+                        cell.append(move)
+                        move = None
+                    cell_fore = (current.fore_r[i], current.fore_g[i], current.fore_b[i])
+                    cell_back = (current.back_r[i], current.back_g[i], current.back_b[i])
+                    if cell_fore != fore:
+                        cell.append(('\x1b[38;2;%d;%d;%dm' % cell_fore).encode('ascii'))
+                    if cell_back != back:
+                        cell.append(('\x1b[48;2;%d;%d;%dm' % cell_back).encode('ascii'))
+                    cell.append(self.glyph(current.char[i]))
+                    cell = b''.join(cell)
+
+                    if size + len(cell) > self.max_frame_bytes:
+                        #Out of budget, whatever is left stays dirty until the next frame
+                        return b''.join(out)
+                    out.append(cell)
+                    size += len(cell)
+                    (fore, back) = (cell_fore, cell_back)
+                    previous.set(x, y, cell_back[0], cell_back[1], cell_back[2],
+                            cell_fore[0], cell_fore[1], cell_fore[2], current.char[i])
+        return b''.join(out)
+
+    def console_flush(self):
+        HeadlessBackend.console_flush(self)
+        data = self.render_frame()
+        if data:
+            self.write(data)
+        self.frame_bytes = len(data)
+        self.total_bytes += len(data)
+
+        #There is no SDL to cap the frame rate, so sleep off the rest of the frame
+        if self.fps > 0:
+            delay = 1.0 / self.fps - (time.time() - self.last_flush)
+            if delay > 0:
+                time.sleep(delay)
+        self.last_flush = time.time()
+
+    def sys_elapsed_milli(self):
+        #Frames are paced by the wall clock here, so animations should be too
+        return int((time.time() - self.started) * 1000)
+
+    ################
+    # Input
+    ################
+
+    def read_input(self, timeout):
+        #Read whatever the terminal sent within timeout seconds, None at end of input
+        if not select.select([self.input], [], [], timeout)[0]:
+            return ''
+        data = os.read(self.input.fileno(), 64)
+        if not data:
+            return None
+        return data.decode('utf-8', 'replace')
+
+    def parse_input(self, data):
+        #Turn raw terminal input into queued key and mouse events
+        while data:
+            if data.startswith('\x1b[<'):
+                #SGR mouse report: ESC [ < button ; x ; y (M for press, m for release)
+                end = min([i for i in (data.find('M'), data.find('m')) if i != -1] or [len(data)])
+                fields = data[3:end].split(';')
+                final = data[end:end + 1]
+                data = data[end + 1:]
+                if len(fields) == 3 and all(field.isdigit() for field in fields):
+                    #Motion reports add 32 to the button number, releases end with 'm'
+                    button = int(fields[0])
+                    pressed = final == 'M' and button < 32
+                    self.push_mouse(int(fields[1]) - 1, int(fields[2]) - 1,
+                            pressed and button == 0, pressed and button == 2)
+                continue
+            for sequence in ('\x1b[A', '\x1b[B', '\x1b[C', '\x1b[D'):
+                if data.startswith(sequence):
+                    self.push_key(self.KEY_SEQUENCES[sequence])
+                    data = data[len(sequence):]
+                    break
+            else:
+                if data.startswith('\x1b[') or data.startswith('\x1bO'):
+                    #Another key's sequence (Home, PgUp, F-keys...), drop it rather than read it as ESC.
+                    #CSI ends with a byte from @ to ~, SS3 is followed by a single letter.
+                    end = 2
+                    if data[1] == '[':
+                        while end < len(data) and not '@' <= data[end] <= '~':
+                            end += 1
+                    data = data[end + 1:]
+                    continue
+                c = data[0]
+                data = data[1:]
+                if c in self.KEY_SEQUENCES:
+                    self.push_key(self.KEY_SEQUENCES[c])
+                elif c == '\x03':
+                    #Ctrl+C, treat it like closing the window
+                    self.closed = True
+                elif ' ' <= c < '\x7f':
+                    self.push_key(libtcod.KEY_CHAR, c)
+
+    def poll(self, timeout):
+        data = self.read_input(timeout)
+        if data is None:
+            self.closed = True
+        elif data:
+            self.parse_input(data)
+
+    def next_event(self, key, mouse):
+        if not self.events and not self.closed:
+            self.poll(0)
+        if not self.events:
+            key.vk = libtcod.KEY_NONE
+            key.c = 0
+            mouse.lbutton_pressed = False
+            mouse.rbutton_pressed = False
+            return libtcod.EVENT_NONE
+        return HeadlessBackend.next_event(self, key, mouse)
+
+    def console_wait_for_keypress(self, flush):
+        while not self.closed and not any(event[0] == 'key' for event in self.events):
+            self.poll(None)
+        return HeadlessBackend.console_wait_for_keypress(self, flush)
+
+def rows_equal(a, b, i, width):
+    #True if width cells starting at i are the same in both planes
+    if libtcod.numpy_available:
+        return (a[i:i + width] == b[i:i + width]).all()
+    return a[i:i + width] == b[i:i + width]
+
+def lerp(a, b, coef):
+    #Linear interpolation between two (r, g, b) tuples
+    return tuple(int(a[i] + (b[i] - a[i]) * coef) for i in range(3))
+
+def create_backend(name):
+    #Look up a backend by the name given on the command line
+    if name == 'sdl':
+        return SDLBackend()
+    elif name == 'headless':
+        return HeadlessBackend()
+    elif name == 'terminal':
+        return TerminalBackend()
+    raise ValueError('Unknown render backend: ' + name)
@@ -27,8 +27,10 @@
 
 import os
 import sys
+import binascii
 import ctypes
 import struct
+from array import array
 from ctypes import *
 
 if not hasattr(ctypes, "c_bool"):   # for Python < 2.6
@@ -436,39 +438,31 @@ class Key(Structure):
 class ConsoleBuffer:
     # simple console that allows direct (fast) access to cells. simplifies
     # use of the "fill" functions.
+    # each plane is a contiguous array of C ints (a NumPy int32 array when
+    # NumPy is available, an array.array('i') otherwise) that is allocated
+    # once and updated in place, so blit can hand its memory straight to
+    # libtcod without building any intermediate ctypes arrays.
+    _planes = ('back_r', 'back_g', 'back_b', 'fore_r', 'fore_g', 'fore_b', 'char')
+
     def __init__(self, width, height, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
         # initialize with given width and height. values to fill the buffer
         # are optional, defaults to black with no characters.
         n = width * height
         self.width = width
         self.height = height
+        for name in self._planes:
+            setattr(self, name, _new_int_plane(n))
+        self._pointers = [_int_plane_pointer(getattr(self, name)) for name in self._planes]
         self.clear(back_r, back_g, back_b, fore_r, fore_g, fore_b, char)
 
     def clear(self, back_r=0, back_g=0, back_b=0, fore_r=0, fore_g=0, fore_b=0, char=' '):
         # clears the console. values to fill it with are optional, defaults
         # to black with no characters.
-        n = self.width * self.height
-        self.back_r = [back_r] * n
-        self.back_g = [back_g] * n
-        self.back_b = [back_b] * n
-        self.fore_r = [fore_r] * n
-        self.fore_g = [fore_g] * n
-        self.fore_b = [fore_b] * n
-        self.char = [ord(char)] * n
+        self.fill(0, 0, self.width, self.height, back_r, back_g, back_b, fore_r, fore_g, fore_b, char)
 
     def copy(self):
         # returns a copy of this ConsoleBuffer.
-        other = ConsoleBuffer(0, 0)
-        other.width = self.width
-        other.height = self.height
-        other.back_r = list(self.back_r)  # make explicit copies of all lists
-        other.back_g = list(self.back_g)
-        other.back_b = list(self.back_b)
-        other.fore_r = list(self.fore_r)
-        other.fore_g = list(self.fore_g)
-        other.fore_b = list(self.fore_b)
-        other.char = list(self.char)
-        return other
+        return self.get_rect(0, 0, self.width, self.height)
 
     def set_fore(self, x, y, r, g, b, char):
         # set the character and foreground color of one cell.
@@ -476,7 +470,7 @@ class ConsoleBuffer:
         self.fore_r[i] = r
         self.fore_g[i] = g
         self.fore_b[i] = b
-        self.char[i] = ord(char)
+        self.char[i] = _char_code(char)
 
     def set_back(self, x, y, r, g, b):
         # set the background color of one cell.
@@ -485,6 +479,10 @@ class ConsoleBuffer:
         self.back_g[i] = g
         self.back_b[i] = b
 
+    def set_char(self, x, y, char):
+        # set the character of one cell, leaving its colors untouched.
+        self.char[self.width * y + x] = _char_code(char)
+
     def set(self, x, y, back_r, back_g, back_b, fore_r, fore_g, fore_b, char):
         # set the background color, foreground color and character of one cell.
         i = self.width * y + x
@@ -494,7 +492,65 @@ class ConsoleBuffer:
         self.fore_r[i] = fore_r
         self.fore_g[i] = fore_g
         self.fore_b[i] = fore_b
-        self.char[i] = ord(char)
+        self.char[i] = _char_code(char)
+
+    def copy_cell(self, x, y, other):
+        # copy one cell (colors and character) from another ConsoleBuffer of
+        # the same width.
+        i = self.width * y + x
+        for name in self._planes:
+            getattr(self, name)[i] = getattr(other, name)[i]
+
+    def fill_back(self, x, y, w, h, r, g, b):
+        # set the background color of a rectangular region.
+        self._fill_plane(self.back_r, x, y, w, h, r)
+        self._fill_plane(self.back_g, x, y, w, h, g)
+        self._fill_plane(self.back_b, x, y, w, h, b)
+
+    def fill_fore(self, x, y, w, h, r, g, b, char):
+        # set the character and foreground color of a rectangular region.
+        self._fill_plane(self.fore_r, x, y, w, h, r)
+        self._fill_plane(self.fore_g, x, y, w, h, g)
+        self._fill_plane(self.fore_b, x, y, w, h, b)
+        self._fill_plane(self.char, x, y, w, h, _char_code(char))
+
+    def set_chars(self, chars):
+        # set the character of every cell at once, from a sequence holding one
+        # character code per cell, at x + y * width.
+        if len(chars) != self.width * self.height:
+            raise ValueError('ConsoleBuffer.set_chars: Sequence has an incorrect size.')
+        if numpy_available:
+            self.char[:] = chars
+        else:
+            self.char[:] = array('i', chars)
+
+    def fill(self, x, y, w, h, back_r, back_g, back_b, fore_r, fore_g, fore_b, char):
+        # set the background color, foreground color and character of a
+        # rectangular region.
+        self.fill_back(x, y, w, h, back_r, back_g, back_b)
+        self.fill_fore(x, y, w, h, fore_r, fore_g, fore_b, char)
+
+    def get_rect(self, x, y, w, h):
+        # returns a new ConsoleBuffer holding a copy of a rectangular region.
+        other = ConsoleBuffer(w, h)
+        for name in self._planes:
+            _copy_plane(getattr(other, name), w, 0, 0, getattr(self, name), self.width, x, y, w, h)
+        return other
+
+    def set_rect(self, x, y, other):
+        # copy all the cells of another ConsoleBuffer into this one, with its
+        # top-left corner at x, y.
+        for name in self._planes:
+            _copy_plane(getattr(self, name), self.width, x, y,
+                        getattr(other, name), other.width, 0, 0, other.width, other.height)
+
+    def _fill_plane(self, plane, x, y, w, h, value):
+        if numpy_available:
+            plane.reshape(self.height, self.width)[y:y + h, x:x + w] = value
+        else:
+            row = array('i', [value]) * w
+            for i in range(self.width * y + x, self.width * (y + h) + x, self.width):
+                plane[i:i + w] = row
 
     def blit(self, dest, fill_fore=True, fill_back=True):
         # use libtcod's "fill" functions to write the buffer to a console.
@@ -502,14 +558,41 @@ class ConsoleBuffer:
             console_get_height(dest) != self.height):
             raise ValueError('ConsoleBuffer.blit: Destination console has an incorrect size.')
 
-        s = struct.Struct('%di' % len(self.back_r))
+        back_r, back_g, back_b, fore_r, fore_g, fore_b, char = self._pointers
 
         if fill_back:
-            _lib.TCOD_console_fill_background(dest, (c_int * len(self.back_r))(*self.back_r), (c_int * len(self.back_g))(*self.back_g), (c_int * len(self.back_b))(*self.back_b))
+            _lib.TCOD_console_fill_background(dest, back_r, back_g, back_b)
 
         if fill_fore:
-            _lib.TCOD_console_fill_foreground(dest, (c_int * len(self.fore_r))(*self.fore_r), (c_int * len(self.fore_g))(*self.fore_g), (c_int * len(self.fore_b))(*self.fore_b))
-            _lib.TCOD_console_fill_char(dest, (c_int * len(self.char))(*self.char))
+            _lib.TCOD_console_fill_foreground(dest, fore_r, fore_g, fore_b)
+            _lib.TCOD_console_fill_char(dest, char)
+
+def _char_code(char):
+    if type(char) == str or type(char) == bytes:
+        return ord(char)
+    return char
+
+def _new_int_plane(n):
+    # a zeroed, contiguous array of n C ints
+    if numpy_available:
+        return numpy.zeros(n, dtype=numpy.int32)
+    return array('i', [0]) * n
+
+def _int_plane_pointer(plane):
+    # pointer to the first element of a plane, without copying it
+    if numpy_available:
+        return plane.ctypes.data_as(POINTER(c_int))
+    return cast(plane.buffer_info()[0], POINTER(c_int))
+
+def _copy_plane(dest, dest_width, dx, dy, src, src_width, sx, sy, w, h):
+    # copy a w*h region between two planes of possibly different widths
+    if numpy_available:
+        dest.reshape(-1, dest_width)[dy:dy + h, dx:dx + w] = src.reshape(-1, src_width)[sy:sy + h, sx:sx + w]
+    else:
+        for row in range(h):
+            d = dest_width * (dy + row) + dx
+            s = src_width * (sy + row) + sx
+            dest[d:d + w] = src[s:s + w]
 
 _lib.TCOD_console_credits_render.restype = c_bool
 _lib.TCOD_console_is_fullscreen.restype = c_bool
@@ -1594,6 +1677,53 @@ def map_get_width(map):
 def map_get_height(map):
     return _lib.TCOD_map_get_height(map)
 
+class _CMap(Structure):
+    _fields_ = [('width', c_int),
+                ('height', c_int),
+                ('nbcells', c_int),
+                ('cells', c_void_p),
+                ]
+
+# each cell of a map is one byte of flags
+_MAP_TRANSPARENT = 1
+_MAP_WALKABLE = 2
+_MAP_FOV = 4
+
+# cell flags to the digit '1' if the cell is in fov, '0' otherwise
+_FOV_DIGITS = bytes(bytearray(ord('1') if i & _MAP_FOV else ord('0') for i in range(256)))
+
+def _map_cells(m):
+    # the cells of a map, at x + y * width, straight over libtcod's own memory
+    cmap = cast(m, POINTER(_CMap)).contents
+    return (c_uint8 * cmap.nbcells).from_address(cmap.cells)
+
+def map_set_cells(m, transparent, walkable):
+    # set the properties of every cell of a map at once, instead of calling
+    # map_set_properties for each of them. transparent and walkable hold one
+    # true or false value per cell, at x + y * width.
+    cells = _map_cells(m)
+    if len(transparent) != len(cells) or len(walkable) != len(cells):
+        raise ValueError('map_set_cells: Sequences have an incorrect size.')
+    if numpy_available:
+        flags = numpy.frombuffer(cells, dtype=numpy.uint8)
+        flags[:] = ((numpy.asarray(transparent) != 0) * _MAP_TRANSPARENT |
+                    (numpy.asarray(walkable) != 0) * _MAP_WALKABLE)
+    else:
+        flags = bytearray((_MAP_TRANSPARENT if t else 0) | (_MAP_WALKABLE if w else 0)
+                          for (t, w) in zip(transparent, walkable))
+        memmove(cells, bytes(flags), len(flags))
+
+def map_get_fov(m):
+    # the result of the last map_compute_fov as a bytearray, one bit per cell: the cell
+    # at i = x + y * width is in fov if bit i & 7 of byte i >> 3 is set. the cells are
+    # copied once and packed in C, instead of calling map_is_in_fov for each of them.
+    cmap = cast(m, POINTER(_CMap)).contents
+    digits = string_at(cmap.cells, cmap.nbcells).translate(_FOV_DIGITS)
+    # read backwards, cell i is bit i of the number, then its bytes are laid out little endian
+    bits = int(digits[::-1], 2)
+    size = (cmap.nbcells + 7) // 8
+    return bytearray(binascii.unhexlify('%0*x' % (size * 2, bits)))[::-1]
+
 ############################
 # pathfinding module
 ############################
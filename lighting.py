@@ -0,0 +1,106 @@
+import shadowcasting
+
+##################################
+# Light sources
+##################################
+#
+#Lights other than the player's torch: campfires, lanterns, burning ground. Each light
+#reaches the cells it has a line of sight to within its radius, dimming with distance.
+#What a light adds to each of those cells (its contribution) only depends on where it
+#is, what it looks like and the terrain, so it is worked out once and kept until one of
+#these changes. Static lights are never worked out again, and the ones that move are
+#redone on their own, without touching the others.
+#
+#Every frame the contributions overlapping the camera are summed into a light buffer,
+#and that sum is also kept until a light or the camera moves.
+
+class Light:
+    #A light source, as a component it follows the object that owns it around, otherwise it
+    #stays at (x, y). A light with a number of turns goes out once they have passed.
+    def __init__(self, radius, color, intensity=1.0, x=0, y=0, turns=None):
+        self.radius = radius
+        self.color = (color.r, color.g, color.b)
+        self.intensity = intensity
+        self.x = x
+        self.y = y
+        self.turns = turns
+        self.owner = None
+
+    def position(self):
+        if self.owner is not None:
+            return (self.owner.x, self.owner.y)
+        return (self.x, self.y)
+
+    def key(self, terrain_version):
+        #Everything the light's contribution depends on
+        return (self.position(), self.radius, self.color, self.intensity, terrain_version)
+
+    def contribution(self, transparent, width, height):
+        #The (cell index, r, g, b) added to each cell the light reaches
+        (x, y) = self.position()
+        mask = shadowcasting.compute_fov(transparent, width, height, x, y, self.radius, True)
+        (r, g, b) = self.color
+        cells = []
+        for cy in range(max(0, y - self.radius), min(height, y + self.radius + 1)):
+            for cx in range(max(0, x - self.radius), min(width, x + self.radius + 1)):
+                i = cx + cy * width
+                if mask[i >> 3] >> (i & 7) & 1:
+                    #Dims linearly with distance, out to nothing just past the radius
+                    falloff = self.intensity * (1.0 - ((cx - x) ** 2 + (cy - y) ** 2) ** 0.5 / (self.radius + 1))
+                    if falloff > 0:
+                        cells.append((i, int(r * falloff), int(g * falloff), int(b * falloff)))
+        return cells
+
+class LightManager:
+    def __init__(self):
+        self.lights = [] #Lights that aren't any object's component
+        self.contributions = {} #Light's id: (key, contribution)
+        self.summed = None
+        self.buffer = {}
+
+    def add(self, light):
+        self.lights.append(light)
+
+    def clear(self):
+        self.lights = []
+
+    def tick(self):
+        #A turn has passed, put out the lights that have burned for long enough
+        for light in self.lights:
+            if light.turns is not None:
+                light.turns -= 1
+        self.lights = [light for light in self.lights if light.turns is None or light.turns > 0]
+
+    def update(self, lights, transparent, width, height, terrain_version, x, y, w, h):
+        #Sum the contributions of lights (the components of objects, and the ones added here) over
+        #the rectangle at (x, y) of size w by h into buffer, a dict of (r, g, b) by (x, y) in the
+        #rectangle. Returns whether buffer changed since the last update.
+        lights = lights + self.lights
+        contributions = {}
+        keys = []
+        for light in lights:
+            key = light.key(terrain_version)
+            cached = self.contributions.get(id(light))
+            if cached is None or cached[0] != key:
+                cached = (key, light.contribution(transparent, width, height))
+            contributions[id(light)] = cached
+            keys.append(key)
+        #Contributions of the lights that are gone are forgotten here
+        self.contributions = contributions
+
+        summed = (tuple(keys), x, y, w, h)
+        if summed == self.summed:
+            return False
+        self.summed = summed
+
+        self.buffer = {}
+        for light in lights:
+            (lx, ly) = light.position()
+            if lx + light.radius < x or lx - light.radius >= x + w or ly + light.radius < y or ly - light.radius >= y + h:
+                continue
+            for (i, r, g, b) in contributions[id(light)][1]:
+                (cx, cy) = (i % width - x, i // width - y)
+                if 0 <= cx < w and 0 <= cy < h:
+                    (br, bg, bb) = self.buffer.get((cx, cy), (0, 0, 0))
+                    self.buffer[(cx, cy)] = (br + r, bg + g, bb + b)
+        return True
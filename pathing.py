@@ -0,0 +1,117 @@
+import collections
+import libtcodpy as libtcod
+
+##################################
+# Path finding
+##################################
+#
+#A* paths over one TCOD map, shared by everything that walks somewhere. Paths are
+#computed with libtcod path objects taken from a pool, so none is created per request,
+#and kept as lists of steps by (start, goal, version). The version stands for whatever
+#the terrain of the map depends on, a path is never used once it changed.
+#
+#A walker following a path asks again from each cell it reaches, so every cell along
+#a path is a start it can be found from. When the goal only moved a little, the path
+#to its old spot is kept and a short path from there to the new one is added to it.
+#Things in the way that the map doesn't know about (other walkers) are only checked
+#on the next few steps, and walked around, the rest of the path is trusted until the
+#walker gets there.
+
+class PathService:
+    def __init__(self, path_map, size=4096, nearby=2, revalidate=3):
+        self.map = path_map
+        self.size = size #Number of (start, goal, version) entries kept
+        self.nearby = nearby #How far a goal may move for the path to it to be kept
+        self.revalidate = revalidate #How many of the next steps are checked for things in the way
+        self.pool = []
+        self.paths = collections.OrderedDict() #(start, goal, version): (steps, index of the next step)
+
+    def close(self):
+        #Delete the pooled path objects, before the map they use goes
+        for path in self.pool:
+            libtcod.path_delete(path)
+        self.pool = []
+        self.paths.clear()
+
+    def inside(self, cell):
+        return 0 <= cell[0] < libtcod.map_get_width(self.map) and 0 <= cell[1] < libtcod.map_get_height(self.map)
+
+    def compute(self, start, goal):
+        #The steps from start to goal, not including start, as a tuple, or None if there is no way
+        path = self.pool.pop() if self.pool else libtcod.path_new_using_map(self.map)
+        try:
+            if not libtcod.path_compute(path, start[0], start[1], goal[0], goal[1]):
+                return None
+            return tuple(libtcod.path_get(path, i) for i in range(libtcod.path_size(path)))
+        finally:
+            self.pool.append(path)
+
+    def remember(self, start, goal, version, steps):
+        #Every cell along the path is a start it can be taken from
+        for (i, cell) in enumerate((start,) + steps):
+            key = (cell, goal, version)
+            self.paths.pop(key, None)
+            self.paths[key] = (steps, i)
+        while len(self.paths) > self.size:
+            self.paths.popitem(last=False)
+
+    def find(self, start, goal, version):
+        #The steps from start to goal as a tuple, reusing the path to a nearby goal if there is one
+        cached = self.paths.get((start, goal, version))
+        if cached is not None:
+            (steps, i) = cached
+            return steps[i:]
+
+        for dy in range(-self.nearby, self.nearby + 1):
+            for dx in range(-self.nearby, self.nearby + 1):
+                cached = self.paths.get((start, (goal[0] + dx, goal[1] + dy), version))
+                if cached is not None and (dx or dy):
+                    (steps, i) = cached
+                    old_goal = steps[-1] if steps else start
+                    rest = self.compute(old_goal, goal)
+                    if rest is not None:
+                        steps = steps[i:] + rest
+                        self.remember(start, goal, version, steps)
+                        return steps
+
+        steps = self.compute(start, goal)
+        if steps is not None:
+            self.remember(start, goal, version, steps)
+        return steps
+
+    def detour(self, start, end, cells):
+        #A path from start to end that doesn't go through cells, or None if there is none. The cells
+        #are taken out of the map just for the computation, the map knows nothing of them otherwise.
+        walkable = [(x, y, libtcod.map_is_transparent(self.map, x, y)) for (x, y) in cells
+                if libtcod.map_is_walkable(self.map, x, y)]
+        for (x, y, transparent) in walkable:
+            libtcod.map_set_properties(self.map, x, y, transparent, False)
+        try:
+            return self.compute(start, end)
+        finally:
+            for (x, y, transparent) in walkable:
+                libtcod.map_set_properties(self.map, x, y, transparent, True)
+
+    def next_step(self, start, goal, version, blocked):
+        #The cell to step into from start on the way to goal, or None if there is no way. blocked(x, y)
+        #tells whether something the map doesn't know about, such as another walker, is in a cell.
+        #Only the next few steps are checked for it, and a way around is found if it is on one.
+        steps = self.find(start, goal, version)
+        if not steps:
+            return None
+        ahead = [i for (i, (x, y)) in enumerate(steps[:self.revalidate]) if (x, y) != goal and blocked(x, y)]
+        if ahead:
+            #Get back on the path right after the last of them, around them and whatever else is next to start
+            rejoin = ahead[-1] + 1
+            cells = set(steps[i] for i in ahead)
+            for dy in (-1, 0, 1):
+                for dx in (-1, 0, 1):
+                    cell = (start[0] + dx, start[1] + dy)
+                    if (dx or dy) and cell not in cells and cell != goal and self.inside(cell) and blocked(*cell):
+                        cells.add(cell)
+            detour = self.detour(start, steps[rejoin], cells)
+            if not detour:
+                return None
+            steps = detour + steps[rejoin + 1:]
+            self.remember(start, goal, version, steps)
+        return steps[0]
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import deque
+
+#Highest resolution clock available (perf_counter doesn't exist on Python 2)
+clock = getattr(time, 'perf_counter', time.time)
+
+class FrameProfiler:
+    #Rolling timings of the phases of a frame. Every start/stop pair adds one sample
+    #(in milliseconds) to its phase, the last window samples of each phase are kept.
+    #When disabled, start and stop return straight away.
+    #
+    #Both the game and the render thread time their phases, so everything touching the
+    #samples holds the lock.
+    def __init__(self, window=120):
+        self.enabled = False
+        self.window = window
+        self.samples = {}
+        self.phases = [] #In the order they were first seen
+        self.started = {}
+        self.lock = threading.Lock()
+
+    def toggle(self):
+        with self.lock:
+            self.enabled = not self.enabled
+            self.started = {}
+
+    def start(self, phase):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.started[phase] = clock()
+
+    def stop(self, phase):
+        if not self.enabled:
+            return
+        now = clock()
+        with self.lock:
+            if phase not in self.started:
+                return
+            elapsed = (now - self.started.pop(phase)) * 1000.0
+            if phase not in self.samples:
+                self.samples[phase] = deque(maxlen=self.window)
+                self.phases.append(phase)
+            self.samples[phase].append(elapsed)
+
+    def stats(self):
+        #List of (phase, mean, p95, max) in milliseconds
+        with self.lock:
+            samples = [(phase, sorted(self.samples[phase])) for phase in self.phases]
+        stats = []
+        for (phase, sorted_samples) in samples:
+            mean = sum(sorted_samples) / len(sorted_samples)
+            p95 = sorted_samples[int(0.95 * (len(sorted_samples) - 1))]
+            stats.append((phase, mean, p95, sorted_samples[-1]))
+        return stats
@@ -0,0 +1,195 @@
+import struct
+import threading
+import zlib
+from array import array
+from bisect import bisect_right
+
+try:
+    from Queue import Queue
+except ImportError:
+    from queue import Queue
+
+##################################
+# Session recordings
+##################################
+#
+#A recording is the sequence of frames that reached the screen, each one stored as
+#the cells that changed since the frame before (a delta), or as every cell of the
+#screen (a keyframe). Keyframes are written whenever most of the screen changed and
+#at least every keyframe_interval frames, so playback can seek without going over
+#the whole session.
+#
+#File layout: the header (MAGIC, then width and height), followed by one block per
+#frame. A block is its kind (KEYFRAME or DELTA), its length, then the frame's record
+#compressed with zlib. Every keyframe starts a new zlib stream, which the deltas after
+#it continue, so decompression can start at any keyframe.
+#
+#Records, before compression, are the timestamp (in milliseconds) and then
+#  keyframe: every cell of each plane
+#  delta:    the number of changed cells, their indices, then their value in each plane
+#Planes are in the order of ConsoleBuffer._planes (background, foreground, character),
+#with values stored as C ints like ConsoleBuffer stores them, so a keyframe is a plain
+#copy of the buffer's memory. zlib squeezes out the unused high bytes.
+
+MAGIC = b'TOQREC1'
+HEADER = struct.Struct('<HH')
+BLOCK = struct.Struct('<cI')
+KEYFRAME = b'K'
+DELTA = b'D'
+
+PLANES = ('back_r', 'back_g', 'back_b', 'fore_r', 'fore_g', 'fore_b', 'char')
+
+class SessionRecorder:
+    #Records frames of a ConsoleBuffer the size of the screen. The calling thread only picks
+    #out the changed cells, compression and writing happen on a writer thread of their own.
+    def __init__(self, path, width, height, keyframe_interval=300):
+        self.width = width
+        self.height = height
+        self.keyframe_interval = keyframe_interval
+        self.since_keyframe = None
+        self.frames = 0
+
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + HEADER.pack(width, height))
+        self.queue = Queue()
+        self.writer = threading.Thread(target=self.write)
+        self.writer.daemon = True
+        self.writer.start()
+
+    def record(self, timestamp, buffer, changed=None):
+        #Record a frame of buffer, changed lists the indices of the cells that changed since
+        #the last one, or is None if the whole screen may have
+        self.frames += 1
+        if (changed is None or self.since_keyframe is None or self.since_keyframe >= self.keyframe_interval or
+                len(changed) * 2 > self.width * self.height):
+            self.since_keyframe = 0
+            record = [struct.pack('<I', timestamp)]
+            for name in PLANES:
+                record.append(_to_bytes(getattr(buffer, name)))
+            self.queue.put((KEYFRAME, b''.join(record)))
+            return
+
+        self.since_keyframe += 1
+        changed = sorted(set(changed))
+        record = [struct.pack('<IH', timestamp, len(changed)), _to_bytes(array('H', changed))]
+        for name in PLANES:
+            plane = getattr(buffer, name)
+            record.append(_to_bytes(array('i', [int(plane[i]) for i in changed])))
+        self.queue.put((DELTA, b''.join(record)))
+
+    def close(self):
+        #Wait for everything recorded to be written, then close the file
+        self.queue.put(None)
+        self.writer.join()
+        self.file.close()
+
+    def write(self):
+        compressor = None
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            (kind, record) = item
+            if kind == KEYFRAME:
+                compressor = zlib.compressobj()
+            #Sync flushing ends the block on a byte boundary, so it can be decompressed on its own
+            data = compressor.compress(record) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            self.file.write(BLOCK.pack(kind, len(data)))
+            self.file.write(data)
+
+class SessionPlayer:
+    #Plays a recording back, frame by frame or by seeking to any frame
+    def __init__(self, path):
+        self.file = open(path, 'rb')
+        if self.file.read(len(MAGIC)) != MAGIC:
+            raise ValueError(path + ' is not a session recording.')
+        (self.width, self.height) = HEADER.unpack(self.file.read(HEADER.size))
+        self.planes = [array('i', [0]) * (self.width * self.height) for name in PLANES]
+
+        #Only the block headers are read here, the frames themselves are decompressed when played
+        self.blocks = []
+        self.keyframes = []
+        while True:
+            header = self.file.read(BLOCK.size)
+            if len(header) < BLOCK.size:
+                break
+            (kind, length) = BLOCK.unpack(header)
+            if kind == KEYFRAME:
+                self.keyframes.append(len(self.blocks))
+            self.blocks.append((kind, self.file.tell(), length))
+            self.file.seek(length, 1)
+
+        self.position = None
+        self.timestamp = 0
+        self.decompressor = None
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def keyframe_before(self, frame):
+        #The last keyframe at or before a frame
+        return self.keyframes[bisect_right(self.keyframes, frame) - 1]
+
+    def keyframe_after(self, frame):
+        #The first keyframe after a frame, or the end of the recording if there is none
+        i = bisect_right(self.keyframes, frame)
+        if i == len(self.keyframes):
+            return len(self.blocks)
+        return self.keyframes[i]
+
+    def seek(self, frame):
+        #Bring the planes to the given frame, starting over from the nearest keyframe unless
+        #playing on from the current frame is shorter
+        key = self.keyframe_before(frame)
+        if self.position is None or self.position > frame or self.position < key:
+            start = key
+        else:
+            start = self.position + 1
+        for i in range(start, frame + 1):
+            self.apply(i)
+        self.position = frame
+        return self.timestamp
+
+    def apply(self, i):
+        (kind, offset, length) = self.blocks[i]
+        self.file.seek(offset)
+        if kind == KEYFRAME:
+            self.decompressor = zlib.decompressobj()
+        record = self.decompressor.decompress(self.file.read(length))
+
+        if kind == KEYFRAME:
+            (self.timestamp,) = struct.unpack_from('<I', record, 0)
+            size = self.width * self.height * self.planes[0].itemsize
+            start = 4
+            for plane in self.planes:
+                del plane[:]
+                _from_bytes(plane, record[start:start + size])
+                start += size
+            return
+
+        (self.timestamp, count) = struct.unpack_from('<IH', record, 0)
+        indices = array('H')
+        _from_bytes(indices, record[6:6 + count * indices.itemsize])
+        start = 6 + count * indices.itemsize
+        for plane in self.planes:
+            values = array('i')
+            _from_bytes(values, record[start:start + count * values.itemsize])
+            for (i, value) in zip(indices, values):
+                plane[i] = value
+            start += count * values.itemsize
+
+    def fill(self, buffer):
+        #Copy the current frame into a ConsoleBuffer of the same size
+        for (name, plane) in zip(PLANES, self.planes):
+            getattr(buffer, name)[:] = plane
+
+def _to_bytes(values):
+    if hasattr(values, 'tobytes'):
+        return values.tobytes()
+    return values.tostring()
+
+def _from_bytes(values, data):
+    if hasattr(values, 'frombytes'):
+        values.frombytes(bytes(data))
+    else:
+        values.fromstring(bytes(data))
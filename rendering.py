@@ -0,0 +1,82 @@
+import threading
+
+##################################
+# Render thread
+##################################
+#
+#The game builds a snapshot of each frame (plain data that is never changed once
+#published) and hands it to a RenderThread, whose draw function turns it into console
+#calls. Snapshots are double buffered: one is being drawn while the game builds the
+#next, and publish only waits if the previous snapshot hasn't been picked up yet, so
+#the game runs at most one frame ahead of the screen.
+#
+#Some backends have to be drawn from the thread that opened them (SDL does), with
+#threaded=False snapshots are drawn straight away by the thread that publishes them.
+#Drawing then still holds up the simulation, so only threaded backends (the terminal)
+#get frames drawn while the game carries on.
+
+class RenderThread:
+    def __init__(self, draw, threaded=True):
+        self.draw = draw
+        self.threaded = threaded
+        self.pending = None #Published, not picked up yet
+        self.drawing = False
+        self.stopped = False
+        self.error = None
+        self.condition = threading.Condition()
+        if threaded:
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+
+    def publish(self, snapshot):
+        if not self.threaded:
+            self.draw(snapshot)
+            return
+        with self.condition:
+            while self.pending is not None and self.error is None:
+                self.condition.wait()
+            self.check()
+            self.pending = snapshot
+            self.condition.notify_all()
+
+    def finish(self):
+        #Wait until everything published is on screen, before drawing to the consoles directly
+        with self.condition:
+            while (self.pending is not None or self.drawing) and self.error is None:
+                self.condition.wait()
+            self.check()
+
+    def stop(self):
+        #Let the thread end once it has drawn everything published
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+
+    def check(self):
+        #Errors of the render thread are raised again in the game's thread
+        if self.error is not None:
+            raise self.error
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.pending is None:
+                    if self.stopped:
+                        return
+                    self.condition.wait()
+                snapshot = self.pending
+                self.pending = None
+                self.drawing = True
+                self.condition.notify_all()
+            try:
+                self.draw(snapshot)
+            except Exception as error:
+                with self.condition:
+                    self.error = error
+                    self.drawing = False
+                    self.condition.notify_all()
+                return
+            with self.condition:
+                self.drawing = False
+                self.condition.notify_all()
@@ -1,15 +1,40 @@
 import libtcodpy as libtcod
+import animation
+import backends
+import binascii
+import collections
+import heapq
+import lighting
 import math
+import operator
+import pathing
+import profiling
+import recording
+import rendering
+import scheduling
+import shadowcasting
+import sys
 import textwrap
 import shelve
+from array import array
+
+try:
+    from itertools import imap #The game's map takes the name map, and Python 2's builds lists
+except ImportError:
+    imap = map
 
 #Actual size of window
 SCREEN_WIDTH = 80
 SCREEN_HEIGHT = 50
 
-#Size of the map
-MAP_WIDTH = 80
-MAP_HEIGHT = 43
+#Size of a chunk of the world
+CHUNK_WIDTH = 80
+CHUNK_HEIGHT = 43
+
+#The map is a square of chunks stitched together, with the player's chunk in the middle
+REGION_CHUNKS = 3
+MAP_WIDTH = CHUNK_WIDTH * REGION_CHUNKS
+MAP_HEIGHT = CHUNK_HEIGHT * REGION_CHUNKS
 
 #Sizes and coordinates relevant to GUI
 BAR_WIDTH = 20
@@ -22,6 +47,10 @@ INVENTORY_WIDTH = 50
 LEVEL_SCREEN_WIDTH = 40
 CHARACTER_SCREEN_WIDTH = 30
 
+#Size of the window into the map that is actually drawn, everything else is culled
+CAMERA_WIDTH = SCREEN_WIDTH
+CAMERA_HEIGHT = SCREEN_HEIGHT - PANEL_HEIGHT
+
 #Spell values
 HEAL_AMOUNT = 4
 ROCK_DAMAGE = 20
@@ -30,6 +59,7 @@ CONFUSE_NUM_TURNS = 10
 CONFUSE_RANGE = 8
 FIREBALL_RADIUS = 3
 FIREBALL_DAMAGE = 12
+FIREBALL_BURN_TURNS = 8
 
 #Experience and Level stats
 LEVEL_UP_BASE = 200
@@ -37,6 +67,22 @@ LEVEL_UP_FACTOR = 150
 
 LIMIT_FPS = 30
 
+#Width of the frame profiler overlay (toggled with F3)
+PROFILER_WIDTH = 32
+
+#Number of chunks shown across and down on the world map, and how far out its colors reach full danger
+MINIMAP_WIDTH = 41
+MINIMAP_HEIGHT = 21
+MINIMAP_DANGER_DISTANCE = 7
+
+#World map glyph and color of each kind of chunk terrain
+MINIMAP_TERRAIN = {
+    'clearing': ('.', libtcod.Color(70, 110, 40)),
+    'forest':   (chr(6), libtcod.Color(30, 80, 30)),
+    'thicket':  (chr(5), libtcod.Color(15, 50, 15)),
+    'cave':     ('#', libtcod.Color(70, 60, 50)),
+}
+
 color_dark_wall = libtcod.Color(18, 17, 17)
 color_light_wall = libtcod.Color(193, 77, 42)
 color_dark_ground = libtcod.Color(32, 32, 32)
@@ -48,9 +94,47 @@ MAX_ROOMS = 30
 MAX_ROOM_MONSTERS = 3
 MAX_ROOM_ITEMS = 5
 
+#One of libtcod's FOV algorithms, or shadowcasting.FOV_SHADOWCASTING to compute FOV in Python
 FOV_ALGO = 0
 FOV_LIGHT_WALLS = True
-TORCH_RADIUS = MAP_HEIGHT
+TORCH_RADIUS = CAMERA_HEIGHT
+
+#Number of FOV results remembered, for positions the player comes back to
+FOV_CACHE_SIZE = 64
+
+#Steps to the eight cells around one
+NEIGHBORS = ((-1, -1), (0, -1), (1, -1), (-1, 0), (1, 0), (-1, 1), (0, 1), (1, 1))
+
+#How far around the player fleeing mobs plan their escape, and how much they favor getting
+#further away over the shortest way out (the safety of a cell is its distance times this)
+FLEE_RADIUS = 12
+FLEE_FACTOR = -1.2
+
+#Bumped whenever the message log, the equipped items or the world (objects, FOV) change, used to stamp GUI widgets
+message_version = 0
+equipment_version = 0
+world_version = 0
+
+#Bumped whenever the tiles that block sight may have changed, cached FOV from before is then never used
+terrain_version = 0
+
+#FOV bitmasks by (longitude, latitude, terrain version, player x, player y), least recently used first
+fov_cache = collections.OrderedDict()
+
+#FOV bitmasks of the viewpoints looked from this turn by (x, y, radius), see can_see
+sight_cache = {}
+
+#Walkable cells for path finding, trees included, created along with the FOV map
+path_map = None
+
+#Fixed point torch shades of the camera's cells by where the player is on screen, see torch_shades
+torch_shade_cache = {}
+
+#Cached A* paths over path_map, shared by everything that walks somewhere, see pathing.py
+paths = None
+
+#Rolling timings of each phase of the main loop, only collected while the overlay is shown
+profiler = profiling.FrameProfiler()
 
 ##################################
 # Generic Classes
@@ -70,21 +154,43 @@ class Tile:
         self.block_sight = block_sight
 
 class Chunk:
-    #Map chunk and its properties
-    def __init__(self, longitude, latitude, objects):
+    #Map chunk and its properties, objects are kept in chunk coordinates while the chunk is not loaded
+    def __init__(self, longitude, latitude, map, objects):
         self.latitude = latitude
         self.longitude = longitude
+        self.map = map
         self.objects = objects
-   
-    def load(self):
-        global objects
-        objects = [] 
-        objects = self.objects
+
+        #Looked at once here, then kept up to date by whatever changes the chunk
+        self.summary = ChunkSummary(chunk_terrain(map, objects), len(map) * len(map[0]),
+                abs(latitude) + abs(longitude))
+        for obj in objects:
+            self.summary.count(obj, 1)
+
+class ChunkSummary:
+    #Tiny overview of a chunk, enough to draw it on the world map without touching its tiles or objects
+    def __init__(self, terrain, cells, distance_from_center):
+        self.terrain = terrain
+        self.cells = cells
+        self.explored = 0
+        self.mobs = 0
+        self.items = 0
+        self.distance_from_center = distance_from_center
+
+    def explored_fraction(self):
+        return float(self.explored) / self.cells
+
+    def count(self, obj, amount):
+        #Add an object to the counts, or take it away with a negative amount
+        if obj.fighter and obj.name != 'player':
+            self.mobs += amount
+        elif obj.item:
+            self.items += amount
 
 class Object:
     #Generic object
     def __init__(self, x, y, char, name, color, blocks = False, 
-            always_visible = False, fighter = None, ai = None, item = None, equipment = None):
+            always_visible = False, fighter = None, ai = None, item = None, equipment = None, light = None):
         self.x = x
         self.y = y
         self.char = char
@@ -108,91 +214,30 @@ class Object:
             #There must be an Item component for the Equipment component to work properly
             self.item = Item()
             self.item.owner = self
+        self.light = light
+        if self.light:
+            self.light.owner = self
 
     def move(self, dx, dy):
         #Move by given amount
-        if self.name == 'player':
-            if not is_map_edge(self.x + dx, self.y + dy):
-                if not is_blocked(self.x + dx, self.y + dy):
-                    self.x += dx
-                    self.y += dy
-            else:
-                global latitude, longitude, chunks, trees, distance_from_center
-                render_all()
-                if self.x + dx >= MAP_WIDTH:
-                    longitude = longitude + 1
-                    for chunk in chunks:
-                        if chunk.latitude == latitude and chunk.longitude == longitude:
-                            self.x = 0
-                            libtcod.console_clear(con)
-                            chunk.load()
-                            distance_from_center = abs(latitude) + abs(longitude)
-                            return
-                    self.x = 0
-                    libtcod.console_clear(con)
-                    make_forest()
-
-                elif self.x + dx < 0:
-                    longitude = longitude - 1
-                    for chunk in chunks:
-                        if chunk.latitude == latitude and chunk.longitude == longitude:
-                            self.x = MAP_WIDTH - 1
-                            chunk.load()
-                            distance_from_center = abs(latitude) + abs(longitude)
-                            return
-                    self.x = MAP_WIDTH - 1
-                    libtcod.console_clear(con)
-                    make_forest()
-
-                elif self.y + dy >= MAP_HEIGHT:
-                    latitude = latitude + 1
-                    for chunk in chunks:
-                        if chunk.latitude == latitude and chunk.longitude == longitude:
-                            self.y = 0
-                            libtcod.console_clear(con)
-                            chunk.load()
-                            distance_from_center = abs(latitude) + abs(longitude)
-                            return
-                    self.y = 0
-                    libtcod.console_clear(con)
-                    make_forest()
-
-                elif self.y + dy < 0:
-                    latitude = latitude - 1
-                    for chunk in chunks:
-                        if chunk.latitude == latitude and chunk.longitude == longitude:
-                            self.y = MAP_HEIGHT - 1
-                            libtcod.console_clear(con)
-                            chunk.load()
-                            distance_from_center = abs(latitude) + abs(longitude)
-                            return
-                    self.y = MAP_HEIGHT - 1
-                    libtcod.console_clear(con)
-                    make_forest()
-                distance_from_center = abs(latitude) + abs(longitude)
-
-        else:
-            if not is_map_edge(self.x + dx, self.y + dy):
-                if not is_blocked(self.x + dx, self.y + dy):
-                    self.x += dx
-                    self.y += dy
-            else:
-                if self.x + dx >= MAP_WIDTH:
-                    message('The ' + self.name + ' flees!', libtcod.yellow)
-                    self.clear()
-                    objects.remove(self)
-                elif self.x + dx < 0:
-                    message('The ' + self.name + ' flees!', libtcod.yellow)
-                    self.clear()
-                    objects.remove(self)
-                elif self.y + dy >= MAP_HEIGHT:
-                    message('The ' + self.name + ' flees!', libtcod.yellow)
-                    self.clear()
-                    objects.remove(self)
-                elif self.y + dy < 0:
-                    message('The ' + self.name + ' flees!', libtcod.yellow)
-                    self.clear()
-                    objects.remove(self)
+        if not is_map_edge(self.x + dx, self.y + dy):
+            if not is_blocked(self.x + dx, self.y + dy):
+                self.x += dx
+                self.y += dy
+                if self.name == 'player':
+                    #Walking out of the middle chunk stitches the region again around the player
+                    recenter_region()
+                else:
+                    left = chunk_summary_at(self.x - dx, self.y - dy)
+                    entered = chunk_summary_at(self.x, self.y)
+                    if entered is not left:
+                        left.count(self, -1)
+                        entered.count(self, 1)
+        elif self.name != 'player':
+            message('The ' + self.name + ' flees!', libtcod.yellow)
+            chunk_summary_at(self.x, self.y).count(self, -1)
+            objects.remove(self)
+            schedule.remove(self)
 
     def move_toward(self, target_x, target_y):
         #Vector from this object to the target
@@ -237,17 +282,14 @@ class Object:
         objects.remove(self)
         objects.append(self)
 
-    def draw(self):
-        #Only show if it is in fov
-        if (libtcod.map_is_in_fov(fov_map, self.x, self.y) or
-                (self.always_visible and map[self.x][self.y].explored)):
-            #set color, draw character
-            libtcod.console_set_default_foreground(con, self.color)
-            libtcod.console_put_char(con, self.x, self.y, self.char, libtcod.BKGND_NONE)
+    def is_visible(self):
+        #Only show if it is in fov, or remembered on an explored tile
+        return (in_fov(self.x, self.y) or
+                (self.always_visible and map[self.x][self.y].explored))
 
-    def clear(self):
-        #erase the character that represents this object
-        libtcod.console_put_char(con, self.x, self.y, ' ', libtcod.BKGND_NONE)
+    def draw(self, layer):
+        #set color, draw character where the camera shows it
+        layer.put(self.x - camera_x, self.y - camera_y, self.color, self.char)
 
 #################################
 # Object Children
@@ -255,7 +297,7 @@ class Object:
 
 class Fighter:
     #Combat-related properties and methods
-    def __init__(self, hp, defense, power, xp, inventory=None, death_function = None):
+    def __init__(self, hp, defense, power, xp, inventory=None, death_function = None, speed = scheduling.NORMAL_SPEED):
         self.base_max_hp = hp
         self.hp = hp
         self.base_defense = defense
@@ -263,6 +305,7 @@ class Fighter:
         self.xp = xp
         self.base_inventory = inventory
         self.death_function = death_function
+        self.speed = speed #How often it acts, see scheduling.py
 
     @property
     def power(self): #Return actual power, by adding bonuses from all equipped items
@@ -298,6 +341,7 @@ class Fighter:
         #Apply damage if possible
         if damage > 0:
             self.hp -= damage
+            animations.add(animation.HitFlash(self.owner))
 
             #Check for death
             if self.hp <= 0:
@@ -315,26 +359,44 @@ class Fighter:
             self.hp = self.max_hp
 
 class BasicMob:
-    #AI for basic mob
+    #AI for basic mob, that notices the player up to sight tiles away
+    def __init__(self, sight = TORCH_RADIUS):
+        self.sight = sight
+        self.last_seen = None #Where the player was last seen, as (x, y, longitude, latitude)
+
     def take_turn(self):
-        #A basic mob takes its turn. If you can see it, it can see you
+        #A basic mob takes its turn, chasing the player once it sees them
         mob = self.owner
-        if libtcod.map_is_in_fov(fov_map, mob.x, mob.y):
+        if can_see(mob, player, self.sight):
+            self.last_seen = (player.x, player.y, longitude, latitude)
 
-            #Move towards the player if far away
+            #Move towards the player if far away, around whatever is in the way if possible
             if mob.distance_to(player) >= 2:
-                mob.move_toward(player.x, player.y)
+                if not step_toward_player(mob):
+                    mob.move_toward(player.x, player.y)
             
             #Close enough, attack (if player is alive)
             elif player.fighter.hp > 0:
                 mob.fighter.attack(player)
 
+        #Lost sight of the player, go look where they were last seen
+        elif self.last_seen is not None:
+            (x, y, seen_longitude, seen_latitude) = self.last_seen
+            step = None
+            if (seen_longitude, seen_latitude) == (longitude, latitude) and (mob.x, mob.y) != (x, y):
+                step = paths.next_step((mob.x, mob.y), (x, y), (longitude, latitude, terrain_version), is_blocked)
+            if step is None:
+                self.last_seen = None
+            else:
+                mob.move(step[0] - mob.x, step[1] - mob.y)
+
 class SkittishMob:
     #Ai for small easily frightened woodland creatures
     def take_turn(self):
         mob = self.owner
         if mob.distance_to(player) < 5:
-            mob.move_away(player.x, player.y)            
+            if not step_away_from_player(mob):
+                mob.move_away(player.x, player.y)
 
 class ConfusedMob:
     #AI for temporarily confused mob (Reverts to previous ai after a while)
@@ -362,6 +424,7 @@ class Item:
         #Add to player's inventory and remove from map
         if self.owner.equipment and get_equipped_in_slot(self.owner.equipment.slot) is None:
             inventory.append(self.owner)
+            chunk_summary_at(self.owner.x, self.owner.y).count(self.owner, -1)
             objects.remove(self.owner)
             self.owner.equipment.equip()            
         elif len(inventory) >= player.fighter.inventory:
@@ -369,6 +432,7 @@ class Item:
             message('Your inventory is full, cannot pick up ' + self.owner.name + '.', libtcod.red)
         else:
             inventory.append(self.owner)
+            chunk_summary_at(self.owner.x, self.owner.y).count(self.owner, -1)
             objects.remove(self.owner)
             message('You picked up ' + self.owner.name + '!', libtcod.green)
 
@@ -388,6 +452,7 @@ class Item:
         
         self.owner.x = player.x
         self.owner.y = player.y
+        chunk_summary_at(player.x, player.y).count(self.owner, 1)
 
         message('You dropped a ' + self.owner.name + '.', libtcod.yellow)
 
@@ -423,16 +488,20 @@ class Equipment:
 
     def equip(self):
         #If the slot is already being used, dequip whatever is there first
+        global equipment_version
         old_equipment = get_equipped_in_slot(self.slot)
         if old_equipment is not None:
             old_equipment.dequip()
 
         self.is_equipped = True
+        equipment_version += 1
         message('Equipped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_green)
 
     def dequip(self):
         #Dequip object and show a message about it
+        global equipment_version
         self.is_equipped = False
+        equipment_version += 1
         message('Dequipped ' + self.owner.name + ' on ' + self.slot + '.', libtcod.light_yellow)
 
 ##################################
@@ -492,41 +561,56 @@ def create_v_tunnel(y1, y2, x):
 # GUI Elements
 ##################################
 
+def menu_console(width, height):
+    #Return the pooled offscreen console for this size, and the menu last drawn on it
+    if (width, height) not in menu_consoles:
+        menu_consoles[(width, height)] = [backend.console_new(width, height), None]
+    return menu_consoles[(width, height)]
+
 def menu(header, options, width):
     if len(options) > 26: ValueError('Cannot have a menu with more than 26 options.')
+    #Menus draw straight to the consoles, so wait for the render thread to be done with them
+    renderer.finish()
+
     #Calculate total height of the header (after auto-wrap) and one line per option
-    header_height = libtcod.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
+    header_height = backend.console_get_height_rect(con, 0, 0, width, SCREEN_HEIGHT, header)
     height = len(options) + header_height
 
     if header == '':
         header_height = 0
 
-    #Create an offscreen console that represents the menu's window
-    window = libtcod.console_new(width, height)
-
-    #Print the header with auto-wrap
-    libtcod.console_set_default_foreground(window, libtcod.white)
-    libtcod.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
-    #Print all of the options
-    y = header_height
-    letter_index = ord('a')
-    for option_text in options:
-        text = '(' + chr(letter_index) + ') ' + option_text
-        libtcod.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
-        y += 1
-        letter_index += 1
+    #Get a pooled offscreen console that represents the menu's window
+    (window, drawn) = menu_console(width, height)
+
+    #Only draw the menu if this console isn't already showing it from a previous open
+    contents = (header, tuple(options))
+    if drawn != contents:
+        backend.console_clear(window)
+
+        #Print the header with auto-wrap
+        backend.console_set_default_foreground(window, libtcod.white)
+        backend.console_print_rect_ex(window, 0, 0, width, height, libtcod.BKGND_NONE, libtcod.LEFT, header)
+        #Print all of the options
+        y = header_height
+        letter_index = ord('a')
+        for option_text in options:
+            text = '(' + chr(letter_index) + ') ' + option_text
+            backend.console_print_ex(window, 0, y, libtcod.BKGND_NONE, libtcod.LEFT, text)
+            y += 1
+            letter_index += 1
+        menu_consoles[(width, height)][1] = contents
 
     #Blit the contents of "window" to the root console
     x = SCREEN_WIDTH/2 - width/2
     y = SCREEN_HEIGHT/2 - height/2
-    libtcod.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
+    backend.console_blit(window, 0, 0, width, height, 0, x, y, 1.0, 0.7)
 
     #Present the root console to the player and wait for a key-press
-    libtcod.console_flush()
-    key = libtcod.console_wait_for_keypress(False)
+    backend.console_flush()
+    key = backend.console_wait_for_keypress(False)
 
     if key.vk == libtcod.KEY_ENTER and key.lalt: #Alt+Enter: toggle fullscreen
-        libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
+        backend.console_set_fullscreen(not backend.console_is_fullscreen())
     
     #Convert the ASCII code to an index; if it corresponds to an option, return it
     index = key.c - ord('a')
@@ -555,25 +639,76 @@ def inventory_menu(header):
 def msgbox(text, width=50):
     menu(text, [], width) #Use menu() as a sort of message box
 
+def show_minimap():
+    #Draw the chunks around the player's one from their summaries alone, one cell per chunk
+    renderer.finish()
+    width = MINIMAP_WIDTH
+    height = MINIMAP_HEIGHT + 2
+    window = menu_console(width, height)[0]
+    backend.console_set_default_background(window, libtcod.black)
+    backend.console_clear(window)
+
+    known = dict(((chunk.longitude, chunk.latitude), chunk.summary) for chunk in chunks)
+    for y in range(MINIMAP_HEIGHT):
+        for x in range(MINIMAP_WIDTH):
+            chunk_longitude = longitude + x - MINIMAP_WIDTH // 2
+            chunk_latitude = latitude + y - MINIMAP_HEIGHT // 2
+            summary = known.get((chunk_longitude, chunk_latitude))
+            if summary is None:
+                continue #Never generated, so there's nothing to show
+
+            #Terrain is brighter the more of the chunk was explored, mobs get redder the further out they are
+            (char, color) = MINIMAP_TERRAIN[summary.terrain]
+            backend.console_set_char_background(window, x, y + 1, color * (0.3 + 0.7 * summary.explored_fraction()))
+            if chunk_longitude == longitude and chunk_latitude == latitude:
+                (char, color) = ('@', libtcod.white)
+            elif summary.mobs:
+                danger = min(1.0, float(summary.distance_from_center) / MINIMAP_DANGER_DISTANCE)
+                (char, color) = (str(min(summary.mobs, 9)), libtcod.color_lerp(libtcod.yellow, libtcod.red, danger))
+            elif summary.items:
+                (char, color) = ('!', libtcod.light_blue)
+            else:
+                color = libtcod.light_grey
+            backend.console_set_default_foreground(window, color)
+            backend.console_put_char(window, x, y + 1, char, libtcod.BKGND_NONE)
+
+    summary = known[(longitude, latitude)]
+    backend.console_set_default_foreground(window, libtcod.white)
+    backend.console_print_ex(window, width / 2, 0, libtcod.BKGND_NONE, libtcod.CENTER, 'World map')
+    backend.console_print_ex(window, width / 2, height - 1, libtcod.BKGND_NONE, libtcod.CENTER,
+            'Explored ' + str(int(summary.explored_fraction() * 100)) + '%, ' + str(summary.mobs) + ' mobs, ' +
+            str(summary.items) + ' items')
+    #The console is shared with menus of the same size, which have to draw themselves again
+    menu_consoles[(width, height)][1] = None
+
+    x = SCREEN_WIDTH/2 - width/2
+    y = SCREEN_HEIGHT/2 - height/2
+    backend.console_blit(window, 0, 0, width, height, 0, x, y)
+    backend.console_flush()
+    backend.console_wait_for_keypress(False)
+
 def render_bar(x, y, total_width, name, value, maximum, bar_color, back_color):
     #Render a bar (HP, XP, ETC), first calculate the width of the bar
     bar_width = int(float(value) / maximum * total_width)
 
     #Render the background first
-    libtcod.console_set_default_background(panel, back_color)
-    libtcod.console_rect(panel, x, y, total_width, 1, False, libtcod.BKGND_SCREEN)
+    panel_drawer.console_set_default_background(panel, back_color)
+    panel_drawer.console_rect(panel, x, y, total_width, 1, False, libtcod.BKGND_SCREEN)
 
     #Now render the bar on top
-    libtcod.console_set_default_background(panel, bar_color)
+    panel_drawer.console_set_default_background(panel, bar_color)
     if bar_width > 0:
-        libtcod.console_rect(panel, x, y, bar_width, 1, False, libtcod.BKGND_SCREEN)
+        panel_drawer.console_rect(panel, x, y, bar_width, 1, False, libtcod.BKGND_SCREEN)
 
     #Finally, some centered texts with values
-    libtcod.console_set_default_foreground(panel, libtcod.white)
-    libtcod.console_print_ex(panel, x + total_width / 2, y, libtcod.BKGND_NONE, libtcod.CENTER,
+    panel_drawer.console_set_default_foreground(panel, libtcod.white)
+    panel_drawer.console_print_ex(panel, x + total_width / 2, y, libtcod.BKGND_NONE, libtcod.CENTER,
             name + ': ' + str(value) + '/' + str(maximum))
 
 def message (new_msg, color = libtcod.white):
+    global message_version
+    message_version += 1
+
     #Split message across lines if necessary
     new_msg_lines = textwrap.wrap(new_msg, MSG_WIDTH)
 
@@ -585,36 +720,280 @@ def message (new_msg, color = libtcod.white):
         #Add the new line as a tuple, with the text and color
         game_msgs.append( (line, color) )
 
+def mouse_map_position():
+    #Return the map cell under the mouse, or (None, None) if the mouse is outside the camera
+    if mouse.cx < 0 or mouse.cy < 0 or mouse.cx >= CAMERA_WIDTH or mouse.cy >= CAMERA_HEIGHT:
+        return (None, None)
+    return (camera_x + mouse.cx, camera_y + mouse.cy)
+
 def get_names_under_mouse():
     global mouse
 
     #Return a string with the names of all objects under the mouse
-    (x, y) = (mouse.cx, mouse.cy)
+    (x, y) = mouse_map_position()
+    if x is None:
+        return ''
 
     #Create a list with the names of all objects at the mouse's coordinates and in fov
     names = [obj.name for obj in objects 
-            if obj.x == x and obj.y == y and libtcod.map_is_in_fov(fov_map, obj.x, obj.y)]
+            if obj.x == x and obj.y == y and in_fov(obj.x, obj.y)]
 
     names = ', '.join(names)
     return names.capitalize()
 
+class EntityLayer:
+    #Glyphs of the entities (or effects) visible this frame, drawn over the background when the frame is composited
+    def __init__(self):
+        self.cells = []
+
+    def put(self, x, y, color, char):
+        self.cells.append((x, y, color, char))
+
+    def stamp(self, buffer):
+        #Write the glyphs into the buffer, keeping the background colour of each cell
+        for (x, y, color, char) in self.cells:
+            buffer.set_fore(x, y, color.r, color.g, color.b, char)
+
+class FrameSnapshot:
+    #Everything the render thread needs to draw a frame, none of it changes once it is published.
+    #The background is only replaced when FOV is recomputed, so most snapshots share it.
+    def __init__(self, background, entities, effects, panel, profiling, changes=None):
+        self.background = background
+        self.entities = entities
+        self.effects = effects
+        self.panel = panel #(stamp, model) of each panel widget
+        self.profiling = profiling #The profiler's stats when its overlay is shown, otherwise None
+        self.changes = changes #(background it was made from, cells that differ from it) when only a few do
+
+class PanelWidget:
+    #A region of the GUI panel that is only redrawn when its version stamp changes. The game
+    #publishes the stamp along with a model of the widget (everything needed to draw it),
+    #the render thread then draws from the model alone.
+    def __init__(self, x, y, width, height):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+        self.version = None #Stamp of what the render thread last drew
+        self.published = (None, None)
+
+    def stamp(self):
+        #Cheap summary of everything the widget shows, overridden by each widget
+        return None
+
+    def model(self):
+        #Only taken when the stamp changes, overridden by each widget
+        return None
+
+    def render(self, model):
+        pass
+
+    def publish(self):
+        #The stamp and model to put in this frame's snapshot
+        stamp = self.stamp()
+        if stamp != self.published[0]:
+            self.published = (stamp, self.model())
+        return self.published
+
+    def update(self, stamp, model):
+        #Redraw the widget if its inputs changed, returns True if it was redrawn
+        if stamp == self.version:
+            return False
+        self.version = stamp
+
+        #Wipe only this widget's region of the panel before drawing it again
+        panel_drawer.console_set_default_background(panel, libtcod.darkest_grey)
+        panel_drawer.console_rect(panel, self.x, self.y, self.width, self.height, True, libtcod.BKGND_SET)
+        self.render(model)
+        return True
+
+class MessageLogWidget(PanelWidget):
+    def stamp(self):
+        return message_version
+
+    def model(self):
+        return tuple(game_msgs)
+
+    def render(self, model):
+        #Print the game messages, one line at a time
+        y = self.y
+        for (line, color) in model:
+            panel_drawer.console_set_default_foreground(panel, color)
+            panel_drawer.console_print_ex(panel, self.x, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+            y += 1
+
+class HealthWidget(PanelWidget):
+    def stamp(self):
+        #max_hp walks the inventory, so stamp the equipment version instead of reading it
+        return (player.fighter.hp, player.fighter.base_max_hp, equipment_version)
+
+    def model(self):
+        return (player.fighter.hp, player.fighter.max_hp)
+
+    def render(self, model):
+        (hp, max_hp) = model
+        render_bar(self.x, self.y, self.width, 'HP', hp, max_hp,
+                libtcod.light_red, libtcod.darker_red)
+
+class ExperienceWidget(PanelWidget):
+    def stamp(self):
+        return (player.fighter.xp, player.level)
+
+    def model(self):
+        return (player.fighter.xp, LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR)
+
+    def render(self, model):
+        (xp, level_up_xp) = model
+        render_bar(self.x, self.y, self.width, 'XP', xp, level_up_xp,
+                libtcod.darker_green, libtcod.darkest_green)
+
+class LevelWidget(PanelWidget):
+    def stamp(self):
+        return (distance_from_center, player.level)
+
+    def model(self):
+        return self.stamp()
+
+    def render(self, model):
+        #Print dungeon level
+        (distance, level) = model
+        panel_drawer.console_set_default_foreground(panel, libtcod.white)
+        panel_drawer.console_print_ex(panel, self.x, self.y, libtcod.BKGND_NONE, libtcod.LEFT,
+                'Dungeon Level: ' + str(distance))
+        panel_drawer.console_print_ex(panel, self.x, self.y + 1, libtcod.BKGND_NONE, libtcod.LEFT,
+                'Player Level: ' + str(level))
+
+class MouseHoverWidget(PanelWidget):
+    def stamp(self):
+        #The names are only looked up again once the mouse moves to another cell or something
+        #in the world changed, idle frames cost a tuple comparison
+        return (mouse.cx, mouse.cy, world_version)
+
+    def model(self):
+        return get_names_under_mouse()
+
+    def render(self, model):
+        #Display names of objects under the mouse
+        panel_drawer.console_set_default_foreground(panel, libtcod.light_gray)
+        panel_drawer.console_print_ex(panel, self.x, self.y, libtcod.BKGND_NONE, libtcod.LEFT, model)
+
+panel_widgets = [
+        MouseHoverWidget(1, 0, SCREEN_WIDTH - 1, 1),
+        HealthWidget(1, 1, BAR_WIDTH, 1),
+        ExperienceWidget(1, 2, BAR_WIDTH, 1),
+        LevelWidget(1, 4, MSG_X - 1, 2),
+        MessageLogWidget(MSG_X, 1, MSG_WIDTH, MSG_HEIGHT)]
+
+def invalidate_panel():
+    #Wipe the retained panel and force every widget to redraw on the next frame
+    panel_drawer.console_set_default_background(panel, libtcod.darkest_grey)
+    panel_drawer.console_clear(panel)
+    for widget in panel_widgets:
+        widget.version = None
+        widget.published = (None, None)
+
 ##################################
 # Functions
 ##################################
 
-def make_forest():
-    global map, objects
-    global latitude, longitude
+def make_forest(longitude, latitude):
+    #Generate the chunk of forest at the given coordinates, its objects are placed in chunk coordinates
+    global map, objects, distance_from_center
 
-    objects = [player]
+    objects = []
 
     map = [[ Tile(False)
-        for y in range(MAP_HEIGHT) ]
-        for x in range(MAP_WIDTH) ]
-    place_objects(Rect(1, 1, MAP_WIDTH - 1, MAP_HEIGHT - 1))
-    new_chunk = Chunk(longitude, latitude, objects)
-    if not any(chunk.latitude == latitude for chunk in chunks) or not any(chunk.longitude == longitude for chunk in chunks):
-        chunks.append(new_chunk)
+        for y in range(CHUNK_HEIGHT) ]
+        for x in range(CHUNK_WIDTH) ]
+
+    #Chunks further from the center are more dangerous
+    distance_from_center = abs(latitude) + abs(longitude)
+    place_objects(Rect(1, 1, CHUNK_WIDTH - 1, CHUNK_HEIGHT - 1))
+    return Chunk(longitude, latitude, map, objects)
+
+def get_chunk(longitude, latitude):
+    #Return the chunk at the given coordinates, generating it the first time it is needed
+    for chunk in chunks:
+        if chunk.longitude == longitude and chunk.latitude == latitude:
+            return chunk
+    chunk = make_forest(longitude, latitude)
+    chunks.append(chunk)
+    return chunk
+
+def load_region():
+    #Stitch the chunks around the player's one into the map, moving their objects into map coordinates
+    global map, objects, region_chunks, distance_from_center
+
+    region_map = [[None] * MAP_HEIGHT for x in range(MAP_WIDTH)]
+    region_objects = [player]
+    region_chunks = []
+    for cy in range(REGION_CHUNKS):
+        for cx in range(REGION_CHUNKS):
+            chunk = get_chunk(longitude + cx - REGION_CHUNKS // 2, latitude + cy - REGION_CHUNKS // 2)
+            (offset_x, offset_y) = (cx * CHUNK_WIDTH, cy * CHUNK_HEIGHT)
+
+            #The tiles are shared with the chunk, so exploring the map explores the chunk
+            for x in range(CHUNK_WIDTH):
+                region_map[offset_x + x][offset_y:offset_y + CHUNK_HEIGHT] = chunk.map[x]
+            for obj in chunk.objects:
+                obj.x += offset_x
+                obj.y += offset_y
+                region_objects.append(obj)
+            chunk.objects = []
+            region_chunks.append(chunk)
+
+    map = region_map
+    objects = region_objects
+    distance_from_center = abs(latitude) + abs(longitude)
+
+    #Mobs that were in the region before keep their turn, the ones coming in act after the player
+    schedule.reset([obj for obj in objects if obj.ai])
+
+def unload_region():
+    #Hand every object but the player back to the chunk it stands in, in that chunk's coordinates
+    for obj in objects:
+        if obj == player:
+            continue
+        (cx, cy) = (obj.x // CHUNK_WIDTH, obj.y // CHUNK_HEIGHT)
+        obj.x -= cx * CHUNK_WIDTH
+        obj.y -= cy * CHUNK_HEIGHT
+        region_chunks[cy * REGION_CHUNKS + cx].objects.append(obj)
+
+def chunk_summary_at(x, y):
+    #Summary of the loaded chunk that a map cell belongs to
+    return region_chunks[(y // CHUNK_HEIGHT) * REGION_CHUNKS + x // CHUNK_WIDTH].summary
+
+def chunk_terrain(map, objects):
+    #The kind of terrain most of a chunk is made of, by its walls and how dense its trees are
+    cells = len(map) * len(map[0])
+    walls = sum(1 for column in map for tile in column if tile.blocked)
+    if walls * 2 > cells:
+        return 'cave'
+    trees = sum(1 for obj in objects if obj.blocks and not obj.fighter)
+    density = float(trees) / (cells - walls)
+    if density < 0.03:
+        return 'clearing'
+    elif density < 0.07:
+        return 'forest'
+    return 'thicket'
+
+def recenter_region():
+    #Once the player leaves the middle chunk, stitch the region again around the chunk they walked into
+    global latitude, longitude
+    dlongitude = player.x // CHUNK_WIDTH - REGION_CHUNKS // 2
+    dlatitude = player.y // CHUNK_HEIGHT - REGION_CHUNKS // 2
+    if dlongitude == 0 and dlatitude == 0:
+        return
+
+    unload_region()
+    longitude += dlongitude
+    latitude += dlatitude
+    player.x -= dlongitude * CHUNK_WIDTH
+    player.y -= dlatitude * CHUNK_HEIGHT
+    load_region()
+    initialize_fov()
+    animations.clear() #They were placed in the old region's coordinates
+    lights.clear()
 
 #def load_forest(Chunk):
 #    objects = []
@@ -739,6 +1118,7 @@ def place_objects(room):
     mob_chances = {}
     mob_chances['squirrel'] = 80 #Bear always shows up even if all other mobs have 0 chance
     mob_chances['bear'] = from_distance([[15, 3], [30, 5], [60, 7]])
+    mob_chances['poacher'] = from_distance([[10, 2], [20, 5]])
 
     #Maximum number of items per room
     max_items = from_distance([[1, 1], [2, 4]])
@@ -756,8 +1136,8 @@ def place_objects(room):
     
     trees = []
 
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
+    for y in range(CHUNK_HEIGHT):
+        for x in range(CHUNK_WIDTH):
             if (random_choice(rubble_chances) == 'tree'):
                 tree = Object(x, y, 179, 'white spruce', libtcod.darker_sepia, blocks=True)
                 trees.append(tree)
@@ -789,8 +1169,9 @@ def place_objects(room):
         if not is_blocked(x, y):
             choice = random_choice(mob_chances)
             if choice == 'squirrel':
-                #Create a squirrel
-                fighter_component = Fighter(hp = 10, defense = 0, power = 3, xp = 35, death_function = mob_death)
+                #Create a squirrel, quicker on its feet than anything else in the woods
+                fighter_component = Fighter(hp = 10, defense = 0, power = 3, xp = 35, death_function = mob_death,
+                        speed = 150)
                 ai_component = SkittishMob()
                 
                 mob = Object(x, y, 's', 'eastern fox squirrel', libtcod.Color(139, 69, 19), blocks = True, 
@@ -798,13 +1179,30 @@ def place_objects(room):
             elif choice == 'bear':
                 #Create a bear
                 fighter_component = Fighter(hp = 16, defense = 10, power = 15, xp = 100, death_function = mob_death)
-                ai_component = BasicMob()
+                ai_component = BasicMob(sight = 12)
                 
                 mob = Object(x, y, 'B', 'brown bear', libtcod.Color(139, 69, 19), blocks = True, 
                         fighter = fighter_component, ai = ai_component)
+            elif choice == 'poacher':
+                #Create a poacher, carrying a lantern
+                fighter_component = Fighter(hp = 20, defense = 2, power = 6, xp = 80, death_function = mob_death)
+                ai_component = BasicMob(sight = 20)
+                light_component = lighting.Light(5, libtcod.light_amber, 0.5)
+
+                mob = Object(x, y, 'p', 'poacher', libtcod.darker_green, blocks = True,
+                        fighter = fighter_component, ai = ai_component, light = light_component)
 
             objects.append(mob)
 
+    #Now and then someone left a campfire burning
+    if libtcod.random_get_int(0, 0, 3) == 0:
+        x = libtcod.random_get_int(0, room.x1 + 1, room.x2 - 1)
+        y = libtcod.random_get_int(0, room.y1 + 1, room.y2 - 1)
+        if not is_blocked(x, y):
+            campfire = Object(x, y, '^', 'campfire', libtcod.flame, light = lighting.Light(7, libtcod.flame, 0.6))
+            objects.append(campfire)
+            campfire.send_to_back()
+
     #Choose random number of items
     num_items = libtcod.random_get_int(0, 0, MAX_ROOM_ITEMS)
 
@@ -853,6 +1251,12 @@ def place_objects(room):
             objects.append(item)
             item.send_to_back() #Items appear below other items
 
+def actor_speed(obj):
+    #Speed of something taking turns, see scheduling.py
+    if obj.fighter:
+        return obj.fighter.speed
+    return scheduling.NORMAL_SPEED
+
 def is_blocked(x, y):
     #First test map tile
     if map[x][y].blocked:
@@ -864,6 +1268,89 @@ def is_blocked(x, y):
             return True
     return False
 
+def player_distances():
+    #The distance to the player from every cell, going around walls and trees. It is worked out
+    #again only once the player has moved, and shared by every mob that reads it.
+    global flow_origin
+    if flow_origin != (player.x, player.y):
+        libtcod.dijkstra_compute(flow_field, player.x, player.y)
+        flow_origin = (player.x, player.y)
+    return flow_field
+
+def step_toward_player(mob):
+    #Take one step down the distance-to-player field. Returns False if no free cell around the
+    #mob is closer to the player.
+    field = player_distances()
+    best = libtcod.dijkstra_get_distance(field, mob.x, mob.y)
+    if best < 0: #The player can't be reached from here
+        return False
+    steps = []
+    for (dx, dy) in NEIGHBORS:
+        (x, y) = (mob.x + dx, mob.y + dy)
+        if 0 <= x < MAP_WIDTH and 0 <= y < MAP_HEIGHT:
+            distance = libtcod.dijkstra_get_distance(field, x, y)
+            if 0 <= distance < best:
+                steps.append((distance, dx, dy))
+
+    #Take the steepest step that isn't taken up by another mob, usually the first one looked at
+    for (distance, dx, dy) in sorted(steps):
+        if not is_blocked(mob.x + dx, mob.y + dy):
+            mob.move(dx, dy)
+            return True
+    return False
+
+def flee_map():
+    #The safety of the cells around the player, lower is safer, as a dict by (x, y). It starts as
+    #the distance to the player times FLEE_FACTOR, then each cell is made no safer than the way
+    #out of it, so fleeing mobs head for open ground rather than into dead ends. Worked out
+    #again only once the player has moved, and shared by every fleeing mob.
+    global flee_origin, flee_safety
+    if flee_origin == (player.x, player.y):
+        return flee_safety
+
+    field = player_distances()
+    safety = {}
+    for y in range(max(0, player.y - FLEE_RADIUS), min(MAP_HEIGHT, player.y + FLEE_RADIUS + 1)):
+        for x in range(max(0, player.x - FLEE_RADIUS), min(MAP_WIDTH, player.x + FLEE_RADIUS + 1)):
+            distance = libtcod.dijkstra_get_distance(field, x, y)
+            if distance >= 0:
+                safety[(x, y)] = distance * FLEE_FACTOR
+
+    queue = [(value, cell) for (cell, value) in safety.items()]
+    heapq.heapify(queue)
+    while queue:
+        (value, (x, y)) = heapq.heappop(queue)
+        if value > safety[(x, y)]:
+            continue
+        for (dx, dy) in NEIGHBORS:
+            cell = (x + dx, y + dy)
+            if cell in safety:
+                through = value + (1.41 if dx and dy else 1.0)
+                if through < safety[cell]:
+                    safety[cell] = through
+                    heapq.heappush(queue, (through, cell))
+
+    (flee_origin, flee_safety) = ((player.x, player.y), safety)
+    return safety
+
+def step_away_from_player(mob):
+    #Take one step down the flee map, or stay put if already as safe as it gets around here.
+    #Returns False if the mob is outside the flee map.
+    safety = flee_map()
+    here = safety.get((mob.x, mob.y))
+    if here is None:
+        return False
+    steps = []
+    for (dx, dy) in NEIGHBORS:
+        value = safety.get((mob.x + dx, mob.y + dy))
+        if value is not None and value < here:
+            steps.append((value, dx, dy))
+    for (value, dx, dy) in sorted(steps):
+        if not is_blocked(mob.x + dx, mob.y + dy):
+            mob.move(dx, dy)
+            break
+    return True
+
 def is_map_edge(x, y):
     if x == MAP_WIDTH or y == MAP_HEIGHT:
         return True
@@ -873,7 +1360,7 @@ def is_map_edge(x, y):
 
 def get_neighbors(size, x, y):
     neighbors = 0
-    libtcod.console_set_char_background(con, x, y, libtcod.red, libtcod.BKGND_SET)
+    backend.console_set_char_background(con, x, y, libtcod.red, libtcod.BKGND_SET)
     for new_x in xrange(x - size, x + size):
         for new_y in xrange(y - size, y + size):
             for tree in trees:
@@ -897,87 +1384,369 @@ def get_all_equipped(obj): #Returns a list of equipped items
     else:
         return [] #No other objects should have equipment
 
+def scale_color(color, value):
+    #Same as color * value, but computed in Python and returned as an (r, g, b) tuple
+    return (min(255, int(color.r * value)), min(255, int(color.g * value)), min(255, int(color.b * value)))
+
+def composite_frame(snapshot):
+    #Lay the snapshot's entity and effect layers over its background into the frame buffer.
+    #Returns the cells that may have changed, or None if the whole frame may have.
+    global presented_background, presented_cells
+    changed = None
+    if snapshot.background is not presented_background:
+        if snapshot.changes is not None and snapshot.changes[0] is presented_background:
+            #Only a few cells of the terrain changed, take those and the ones entities covered
+            changed = snapshot.changes[1] + presented_cells
+            for (x, y) in changed:
+                frame_buffer.copy_cell(x, y, snapshot.background)
+        else:
+            #The terrain itself changed, start from a fresh copy of it
+            frame_buffer.set_rect(0, 0, snapshot.background)
+        presented_background = snapshot.background
+    else:
+        #Otherwise only the cells entities and effects covered last frame need their terrain back
+        for (x, y) in presented_cells:
+            frame_buffer.copy_cell(x, y, snapshot.background)
+        changed = presented_cells
+    snapshot.entities.stamp(frame_buffer)
+    snapshot.effects.stamp(frame_buffer)
+    presented_cells = [(x, y) for (x, y, color, char) in snapshot.entities.cells + snapshot.effects.cells]
+    if changed is not None:
+        changed = changed + presented_cells
+    return changed
+
+def present_frame(snapshot):
+    #Draw a published snapshot and show it, on the render thread. Only the snapshot and the
+    #consoles the render thread owns are touched here, never the game state.
+    profiler.start('composite')
+    changed = composite_frame(snapshot)
+    profiler.stop('composite')
+
+    #The panel is retained between frames, only redraw the widgets whose inputs changed
+    profiler.start('panel')
+    redrawn = []
+    for (widget, (stamp, model)) in zip(panel_widgets, snapshot.panel):
+        if widget.update(stamp, model):
+            redrawn.append(widget)
+    profiler.stop('panel')
+
+    #Send the whole frame to con with one fill per plane, the panel too if a widget was redrawn,
+    #then blit both to the root console
+    profiler.start('blit')
+    backend.buffer_blit(frame_buffer, con)
+    if redrawn:
+        backend.buffer_blit(panel_buffer, panel_con)
+    backend.console_blit(con, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
+    backend.console_blit(panel_con, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
+    profiler.stop('blit')
+    if recorder is not None:
+        profiler.start('record')
+        record_frame(changed, redrawn)
+        profiler.stop('record')
+    if snapshot.profiling is not None:
+        render_profiler(snapshot.profiling)
+
+    profiler.start('flush')
+    backend.console_flush()
+    profiler.stop('flush')
+
+def put_effect(x, y, color, char):
+    #Put a cell of an effect on the effect layer, if the player can see it
+    if in_camera(x, y) and in_fov(x, y):
+        effect_layer.put(x - camera_x, y - camera_y, color, char)
+
+def move_camera():
+    #Center the camera on the player, without letting it show anything past the edges of the map
+    global camera_x, camera_y
+    camera_x = min(max(0, player.x - CAMERA_WIDTH // 2), MAP_WIDTH - CAMERA_WIDTH)
+    camera_y = min(max(0, player.y - CAMERA_HEIGHT // 2), MAP_HEIGHT - CAMERA_HEIGHT)
+
+def in_camera(x, y):
+    return camera_x <= x < camera_x + CAMERA_WIDTH and camera_y <= y < camera_y + CAMERA_HEIGHT
+
+def world_changed():
+    #Note that objects or visibility may have changed, so anything cached from them is stale
+    global world_version
+    world_version += 1
+
+def terrain_changed():
+    #Note that the tiles blocking sight may have changed, so FOV has to be computed again everywhere
+    global terrain_version
+    terrain_version += 1
+
+def fov_from(x, y, radius):
+    #FOV from any cell as a bitmask over map cells, computed with FOV_ALGO
+    if FOV_ALGO == shadowcasting.FOV_SHADOWCASTING:
+        return shadowcasting.compute_fov(transparent_cells, MAP_WIDTH, MAP_HEIGHT, x, y, radius, FOV_LIGHT_WALLS)
+    libtcod.map_compute_fov(fov_map, x, y, radius, FOV_LIGHT_WALLS, FOV_ALGO)
+    return libtcod.map_get_fov(fov_map)
+
+def compute_fov():
+    #FOV from the player's position as a bitmask over map cells, computed only the first time
+    #the player stands there. The region is always stitched the same way around the chunk at
+    #(longitude, latitude), so together with the terrain version it fixes the map.
+    key = (longitude, latitude, terrain_version, player.x, player.y)
+    mask = fov_cache.pop(key, None)
+    if mask is None:
+        mask = fov_from(player.x, player.y, TORCH_RADIUS)
+        if len(fov_cache) >= FOV_CACHE_SIZE:
+            fov_cache.popitem(last=False)
+    fov_cache[key] = mask
+    return mask
+
+def can_see(viewer, target, radius = TORCH_RADIUS):
+    #Whether viewer sees target, looking no further than radius. Sight goes both ways in this
+    #game, so the player's own FOV answers whenever one of them is the player and the radius is
+    #within the torch's. Any other viewpoint's FOV is computed once a turn, however often asked.
+    (dx, dy) = (target.x - viewer.x, target.y - viewer.y)
+    if dx * dx + dy * dy > radius * radius:
+        return False
+    if target is player and radius <= TORCH_RADIUS:
+        (viewer, target) = (target, viewer)
+    if viewer is player and radius <= TORCH_RADIUS:
+        key = (player.x, player.y, TORCH_RADIUS)
+    else:
+        key = (viewer.x, viewer.y, radius)
+    mask = sight_cache.get(key)
+    if mask is None:
+        if viewer is player and key[2] == TORCH_RADIUS:
+            mask = compute_fov()
+        else:
+            mask = fov_from(viewer.x, viewer.y, radius)
+        sight_cache[key] = mask
+    i = target.y * MAP_WIDTH + target.x
+    return mask[i >> 3] >> (i & 7) & 1
+
+def fov_changes(old, new):
+    #Indices of the map cells that came into or went out of FOV between two bitmasks. The masks
+    #are XORed as whole numbers and only the set bits are visited, so the work done in Python
+    #follows the edge of the visible area rather than the size of the map.
+    diff = int(binascii.hexlify(old[::-1]), 16) ^ int(binascii.hexlify(new[::-1]), 16)
+    bits = bin(diff)
+    last = len(bits) - 1
+    changes = []
+    i = bits.find('1', 2)
+    while i != -1:
+        changes.append(last - i)
+        i = bits.find('1', i + 1)
+    return changes
+
+def cells_entering_camera(old_camera):
+    #Map cells under the camera that weren't under it at old_camera, or all of them if that is None.
+    #After a step these are a single row and column.
+    cells = []
+    for y in range(camera_y, camera_y + CAMERA_HEIGHT):
+        if old_camera is None or not old_camera[1] <= y < old_camera[1] + CAMERA_HEIGHT:
+            columns = range(camera_x, camera_x + CAMERA_WIDTH)
+        else:
+            columns = (list(range(camera_x, min(camera_x + CAMERA_WIDTH, old_camera[0]))) +
+                    list(range(max(camera_x, old_camera[0] + CAMERA_WIDTH), camera_x + CAMERA_WIDTH)))
+        cells.extend((x, y) for x in columns)
+    return cells
+
+def in_fov(x, y):
+    #Whether a map cell was in FOV at the last computation
+    i = y * MAP_WIDTH + x
+    return fov_mask[i >> 3] >> (i & 7) & 1
+
+def relight_cell(x, y):
+    #Bring the look of one map cell in lit_map and memory_map up to date, after it came into or
+    #went out of FOV or was explored. The back colors are kept before the torch shades them.
+    i = y * MAP_WIDTH + x
+    wall = map[x][y].block_sight
+    (fore_r, fore_g, fore_b, char) = (dark_map.fore_r[i], dark_map.fore_g[i], dark_map.fore_b[i], dark_map.char[i])
+    (lit, remembered) = ((0, 0, 0), (0, 0, 0))
+    if in_fov(x, y):
+        lit = scale_color(color_light_wall if wall else color_light_ground, 0.35)
+        if not wall:
+            (fore_r, fore_g, fore_b) = (libtcod.dark_orange.r, libtcod.dark_orange.g, libtcod.dark_orange.b)
+    elif map[x][y].explored:
+        remembered = scale_color(color_dark_wall if wall else color_dark_ground, 0.075)
+        if not wall:
+            char = ' '
+    #Walls keep the glyph they have unexplored, only their background changes
+    lit_map.set(x, y, lit[0], lit[1], lit[2], fore_r, fore_g, fore_b, char)
+    memory_map.set_back(x, y, remembered[0], remembered[1], remembered[2])
+
+def torch_shades():
+    #How much the torch brightens the visible cells and dims the remembered ones, at each cell of
+    #the camera, in fixed point (65536 is 1.0). Both only depend on the distance to the player, so
+    #they are the same every frame while the player stays in the middle of the screen.
+    key = (player.x - camera_x, player.y - camera_y)
+    shades = torch_shade_cache.get(key)
+    if shades is None:
+        (lit, remembered) = ([], [])
+        for sy in range(CAMERA_HEIGHT):
+            for sx in range(CAMERA_WIDTH):
+                distance = ((sx - key[0]) ** 2 + (sy - key[1]) ** 2) ** 0.5
+                #Square root to make the transition non linear
+                lit.append(int(abs(TORCH_RADIUS + 1 - distance) ** 0.5 * 65536))
+                remembered.append(int(abs(SCREEN_WIDTH - distance) ** 0.5 * 65536))
+        shades = torch_shade_cache[key] = (lit, remembered)
+    return shades
+
+def shade_plane(plane, shade, other, other_shade):
+    #plane * shade + other * other_shade in fixed point, capped at 255, into plane. The loop runs
+    #over whole planes at once, in C, either as NumPy arrays or through imap over arrays of ints.
+    if libtcod.numpy_available:
+        plane[:] = ((plane * shade + other * other_shade) >> 16).clip(0, 255)
+    else:
+        n = len(plane)
+        plane[:] = array('i', imap(min, imap(operator.rshift, imap(operator.add, imap(operator.mul, plane, shade),
+                imap(operator.mul, other, other_shade)), [16] * n), [255] * n))
+
+def light_screen_cell(background, sx, sy):
+    #Light a single cell of the camera into background, as compose_background does for all of them
+    i = (camera_y + sy) * MAP_WIDTH + camera_x + sx
+    j = sy * CAMERA_WIDTH + sx
+    (lit, remembered) = torch_shades()
+    back = [min(255, (getattr(lit_map, plane)[i] * lit[j] + getattr(memory_map, plane)[i] * remembered[j]) >> 16)
+            for plane in ('back_r', 'back_g', 'back_b')]
+    (r, g, b) = lights.buffer.get((sx, sy), (0, 0, 0))
+    if in_fov(camera_x + sx, camera_y + sy):
+        back = [min(255, back[0] + r), min(255, back[1] + g), min(255, back[2] + b)]
+    background.set(sx, sy, back[0], back[1], back[2], lit_map.fore_r[i], lit_map.fore_g[i], lit_map.fore_b[i],
+            lit_map.char[i])
+
+def compose_background():
+    #The camera's view of lit_map, shaded by the torch and with the other lights added, as a new
+    #buffer (the one in the last snapshot may still be drawn). All of it is copied and shaded in
+    #bulk, only the cells other lights reach are worked out one at a time.
+    view = lit_map.get_rect(camera_x, camera_y, CAMERA_WIDTH, CAMERA_HEIGHT)
+    memory = memory_map.get_rect(camera_x, camera_y, CAMERA_WIDTH, CAMERA_HEIGHT)
+    (lit, remembered) = torch_shades()
+    for plane in ('back_r', 'back_g', 'back_b'):
+        shade_plane(getattr(view, plane), lit, getattr(memory, plane), remembered)
+
+    #Add the other lights to the cells the player can see
+    for ((sx, sy), (r, g, b)) in lights.buffer.items():
+        if in_fov(camera_x + sx, camera_y + sy):
+            i = sx + sy * CAMERA_WIDTH
+            view.set_back(sx, sy, min(255, view.back_r[i] + r), min(255, view.back_g[i] + g),
+                    min(255, view.back_b[i] + b))
+
+    background = libtcod.ConsoleBuffer(SCREEN_WIDTH, SCREEN_HEIGHT)
+    background.set_rect(0, 0, view)
+    return background
+
 def render_all():
     global fov_map, color_dark_wall, color_light_wall
     global color_dark_ground, color_light_ground
-    global fov_recompute
+    global fov_recompute, fov_mask, fov_camera, lit_from, background, entity_layer, effect_layer
 
+    #Map cells whose look changed since the last frame
+    changed = []
     if fov_recompute:
-        #Recompute FOV
+        #The camera only moves with the player, and everything outside it is culled from here on
         fov_recompute = False
-        libtcod.map_compute_fov(fov_map, player.x, player.y, TORCH_RADIUS, FOV_LIGHT_WALLS, FOV_ALGO)
-        for y in range(MAP_HEIGHT):
-            for x in range(MAP_WIDTH):
-                visible = libtcod.map_is_in_fov(fov_map, x, y)
-                wall = map[x][y].block_sight
-
-                distance_light = TORCH_RADIUS + 1 - player.distance(x, y) #Make the light dimmer further from player
-                distance_dark = SCREEN_WIDTH - player.distance(x, y)
-                distance_light = abs(distance_light) ** 0.5 #Square root to make transition non linear
-                distance_dark = abs(distance_dark) ** 0.5
-     
-                if not visible:
-                    #If it's not visible right now, the player can only see it if it is already explored
-                    if map[x][y].explored:
-                        #It is out of FOV
-                        if wall:
-                            libtcod.console_set_char_background(con, x, y, 
-                                    color_dark_wall * (0.075) * distance_dark, libtcod.BKGND_SET)
-                        else:
-                            libtcod.console_set_char_background(con, x, y, 
-                                    color_dark_ground * (0.075) * distance_dark, libtcod.BKGND_SET)
-                            libtcod.console_set_char(con, x, y, ' ')
-                else:
-                    #It's visible
-                    if wall:
-                        libtcod.console_set_char_background(con, x, y, 
-                                color_light_wall * (0.35) * distance_light, libtcod.BKGND_SET)
-                    else:
-                        libtcod.console_set_char_background(con, x, y, 
-                                color_light_ground * (0.35) * distance_light, libtcod.BKGND_SET)
-                        libtcod.console_set_char_foreground(con, x, y, libtcod.dark_orange)
-                        libtcod.console_set_char(con, x, y, map[x][y].char)
-                    #Since it is visible, explore it
-                    map[x][y].explored = True
-
-    #draw all objects in the list
-    for object in objects:
-        object.draw()
-    player.draw()
-
-    #Blit to con
-    libtcod.console_blit(con, 0, 0, SCREEN_WIDTH, SCREEN_HEIGHT, 0, 0, 0)
-
-    #Prepare to render GUI panel
-    libtcod.console_set_default_background(panel, libtcod.darkest_grey)
-    libtcod.console_clear(panel)
-
-    #Print the game messages, one line at a time
-    y = 1
-    for (line, color) in game_msgs:
-        libtcod.console_set_default_foreground(panel, color)
-        libtcod.console_print_ex(panel, MSG_X, y, libtcod.BKGND_NONE, libtcod.LEFT, line)
+        move_camera()
+
+        #Recompute FOV, or look it up if the player has stood here before
+        profiler.start('fov')
+        (old_mask, fov_mask) = (fov_mask, compute_fov())
+
+        #Explore what comes into sight: cells that came into FOV, and cells in FOV that came
+        #under the camera. After a step both only run along the edges of what the player sees.
+        changed = [(i % MAP_WIDTH, i // MAP_WIDTH) for i in fov_changes(old_mask, fov_mask)]
+        for (x, y) in changed + cells_entering_camera(fov_camera):
+            if in_camera(x, y) and in_fov(x, y) and not map[x][y].explored:
+                map[x][y].explored = True
+                chunk_summary_at(x, y).explored += 1
+                changed.append((x, y))
+        fov_camera = (camera_x, camera_y)
+        profiler.stop('fov')
+
+    #Sum up the other light sources around the camera, only the ones that moved are worked out again
+    profiler.start('lights')
+    carried = [object.light for object in objects if object.light]
+    lit_before = lights.buffer
+    relit = lights.update(carried, transparent_cells, MAP_WIDTH, MAP_HEIGHT, terrain_version,
+            camera_x, camera_y, CAMERA_WIDTH, CAMERA_HEIGHT)
+    profiler.stop('lights')
+
+    #Every cell on screen changes when the camera scrolls, or when the torch moves with the player
+    moved = lit_from != (camera_x, camera_y, player.x, player.y)
+    changes = None
+    if changed or moved or relit:
+        profiler.start('lighting')
+        #Only the cells that came into or out of sight, or were explored, are lit again on the map
+        for (x, y) in changed:
+            relight_cell(x, y)
+
+        if moved:
+            #Copy and shade the whole view in bulk
+            background = compose_background()
+            lit_from = (camera_x, camera_y, player.x, player.y)
+        else:
+            #Otherwise only the changed cells under the camera, and the ones other lights changed
+            dirty = set((x - camera_x, y - camera_y) for (x, y) in changed if in_camera(x, y))
+            if relit:
+                dirty.update(cell for cell in set(lit_before) | set(lights.buffer)
+                        if lit_before.get(cell) != lights.buffer.get(cell))
+            (base, background) = (background, background.copy())
+            for (sx, sy) in dirty:
+                light_screen_cell(background, sx, sy)
+            changes = (base, list(dirty))
+        world_changed()
+        profiler.stop('lighting')
+
+    profiler.start('objects')
+
+    #Collect the visible objects under the camera once, the player is drawn last so it stays on top
+    visible_objects = [object for object in objects
+            if object != player and in_camera(object.x, object.y) and object.is_visible()]
+    if player.is_visible():
+        visible_objects.append(player)
+
+    entity_layer = EntityLayer()
+    for object in visible_objects:
+        object.draw(entity_layer)
+
+    #Effects play out over the next frames on their own layer, nothing waits for them
+    effect_layer = EntityLayer()
+    animations.draw(put_effect)
+    profiler.stop('objects')
+
+    #Hand the frame over to the render thread, which draws it while the game carries on
+    profiler.start('publish')
+    widgets = [widget.publish() for widget in panel_widgets]
+    stats = profiler.stats() if profiler.enabled else None
+    renderer.publish(FrameSnapshot(background, entity_layer, effect_layer, widgets, stats, changes))
+    profiler.stop('publish')
+
+def record_frame(changed, redrawn):
+    #Add the frame to the session recording. The frame buffer only holds the map, so the panel
+    #(drawn in memory, in panel_buffer) is copied below it.
+    frame_buffer.set_rect(0, PANEL_Y, panel_buffer)
+
+    if changed is not None:
+        changed = [y * SCREEN_WIDTH + x for (x, y) in changed]
+        for widget in redrawn:
+            for y in range(widget.y, widget.y + widget.height):
+                row = (PANEL_Y + y) * SCREEN_WIDTH + widget.x
+                changed.extend(range(row, row + widget.width))
+    recorder.record(backend.sys_elapsed_milli(), frame_buffer, changed)
+
+def render_profiler(stats):
+    #Overlay the rolling frame timings (profiler stats taken on the game thread) in the top right corner of the root console
+    lines = ['phase        mean   p95   max']
+    for (phase, mean, p95, worst) in stats:
+        lines.append('%-11s %5.1f %5.1f %5.1f' % (phase, mean, p95, worst))
+    lines.append('(ms, F3 to hide)')
+
+    #Backends that send frames over the wire count the bytes, show the last frame's and the average
+    if getattr(backend, 'frame_bytes', None) is not None:
+        lines.append('bytes %6d last %6d avg' % (backend.frame_bytes, backend.total_bytes // max(1, backend.frames)))
+
+    width = PROFILER_WIDTH
+    backend.console_set_default_background(0, libtcod.black)
+    backend.console_set_default_foreground(0, libtcod.light_green)
+    backend.console_rect(0, SCREEN_WIDTH - width, 0, width, len(lines), True, libtcod.BKGND_SET)
+    y = 0
+    for line in lines:
+        backend.console_print_ex(0, SCREEN_WIDTH - width + 1, y, libtcod.BKGND_SET, libtcod.LEFT, line)
         y += 1
 
-    #Show the player's stats
-    render_bar(1, 1, BAR_WIDTH, 'HP', player.fighter.hp, player.fighter.max_hp,
-            libtcod.light_red, libtcod.darker_red)
-    
-    level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
-    render_bar(1, 2, BAR_WIDTH, 'XP', player.fighter.xp, level_up_xp,
-            libtcod.darker_green, libtcod.darkest_green)
-
-    #Print dungeon level
-    libtcod.console_print_ex(panel, 1, 4, libtcod.BKGND_NONE, libtcod.LEFT, 'Dungeon Level: ' + str(distance_from_center))
-    libtcod.console_print_ex(panel, 1, 5, libtcod.BKGND_NONE, libtcod.LEFT, 'Player Level: ' + str(player.level))
-
-    #Display names of objects under the mouse
-    libtcod.console_set_default_foreground(panel, libtcod.light_gray)
-    libtcod.console_print_ex(panel, 1, 0, libtcod.BKGND_NONE, libtcod.LEFT, get_names_under_mouse())
-
-    #Blit the contents of panel to root console
-    libtcod.console_blit(panel, 0, 0, SCREEN_WIDTH, PANEL_HEIGHT, 0, 0, PANEL_Y)
-
 def player_move_or_attack(dx, dy):
     global fov_recompute
 
@@ -1004,11 +1773,14 @@ def handle_keys():
     global key
  
     if key.vk == libtcod.KEY_ENTER and key.lalt: #Alt+Enter: toggle fullscreen
-        libtcod.console_set_fullscreen(not libtcod.console_is_fullscreen())
+        backend.console_set_fullscreen(not backend.console_is_fullscreen())
                      
     elif key.vk == libtcod.KEY_ESCAPE:
         return 'exit'  #exit game
 
+    elif key.vk == libtcod.KEY_F3: #F3: toggle the frame profiler overlay
+        profiler.toggle()
+
     if game_state == 'playing':
         #Movement Keys
         if key.vk == libtcod.KEY_UP:
@@ -1051,6 +1823,10 @@ def handle_keys():
                 if stairs.x == player.x and stairs.y == player.y:
                     next_level()
 
+            if key.c == ord('m'):
+                #Show the world map
+                show_minimap()
+
             if key.c == ord('c'):
                 #Show character information
                 level_up_xp = LEVEL_UP_BASE + player.level * LEVEL_UP_FACTOR
@@ -1076,11 +1852,13 @@ def mob_death(mob):
     #Transform into corpse, remove blocking, can't be attacked or move
     message(mob.name.capitalize() + ' is dead! You gain ' + str(mob.fighter.xp) +
             ' experiecne points.' , libtcod.orange)
+    chunk_summary_at(mob.x, mob.y).count(mob, -1)
     mob.char = '%'
     mob.color = libtcod.dark_red
     mob.blocks = False
     mob.fighter = None
     mob.ai = None
+    schedule.remove(mob)
     mob.name = 'remains of ' + mob.name
     mob.send_to_back()
 
@@ -1112,17 +1890,16 @@ def target_tile(max_range=None):
     global key, mouse
     while True:
         #Render the screen, this erases the inventory and shows the name of objects under the mouse.
-        libtcod.console_flush()
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE, key, mouse)
+        backend.sys_check_for_event(libtcod.EVENT_KEY_PRESS|libtcod.EVENT_MOUSE, key, mouse)
         render_all()
 
-        (x, y) = (mouse.cx, mouse.cy)
+        (x, y) = mouse_map_position()
 
         if mouse.rbutton_pressed or key.vk == libtcod.KEY_ESCAPE:
             message('Attack canceled')
             return (None, None) #Cancel if the player right clicked or pressed escape
         #Accept the target if the player clicked in FOV
-        if (mouse.lbutton_pressed and libtcod.map_is_in_fov(fov_map, x, y) and
+        if (mouse.lbutton_pressed and x is not None and in_fov(x, y) and
                 (max_range is None or player.distance(x, y) <= max_range)):
             return(x, y)
 
@@ -1144,7 +1921,7 @@ def closest_mob(max_range):
     closest_dist = max_range + 1 #Start with slightly more than max range
 
     for object in objects:
-        if object.fighter and not object == player and libtcod.map_is_in_fov(fov_map, object.x, object.y):
+        if object.fighter and not object == player and can_see(player, object):
             #Calculate the distance between this object and the player
             dist = player.distance_to(object)
             if dist < closest_dist: #It's closer, so remember it
@@ -1176,6 +1953,10 @@ def throw_rock():
         message('No enemy is close enough to strike.', libtcod.red)
         return 'cancelled'
     
+    #The rock flies from the player to the target, whether it hits or not
+    path = list(libtcod.line_iter(player.x, player.y, x, y))[1:]
+    animations.add(animation.ProjectileTrail(path, '*', libtcod.light_grey))
+
     distance = mob.distance_to(player)
     distance = int(round(distance))
 
@@ -1198,12 +1979,21 @@ def cast_fireball():
     (x, y) = target_tile()
     if x is None: return 'cancelled'
     message('The fireball explodes, burning everything within ' + str(FIREBALL_RADIUS) + ' tiles!', libtcod.orange)
+    animations.add(animation.ExplosionRing(x, y, FIREBALL_RADIUS))
 
     for obj in objects: #Damage every fighter in range, including the player
         if obj.distance(x, y) <= FIREBALL_RADIUS and obj.fighter:
             message('The ' + obj.name + ' gets burned for ' + str(FIREBALL_DAMAGE) + ' hit points.', libtcod.orange)
             obj.fighter.take_damage(FIREBALL_DAMAGE)
 
+    #Some of the ground it hit keeps burning for a while
+    for by in range(y - FIREBALL_RADIUS, y + FIREBALL_RADIUS + 1):
+        for bx in range(x - FIREBALL_RADIUS, x + FIREBALL_RADIUS + 1):
+            if (0 <= bx < MAP_WIDTH and 0 <= by < MAP_HEIGHT and not map[bx][by].block_sight and
+                    math.hypot(bx - x, by - y) <= FIREBALL_RADIUS and libtcod.random_get_int(0, 0, 2) == 0):
+                lights.add(lighting.Light(2, libtcod.flame, 0.5, bx, by,
+                        turns=libtcod.random_get_int(0, 2, FIREBALL_BURN_TURNS)))
+
 def cast_confuse():
     #Ask the player for a target to confuse
     message('Left-click an enemy to confuse it, or right-click to cancel.', libtcod.light_cyan)
@@ -1221,21 +2011,23 @@ def cast_confuse():
 ##################################
 
 def new_game():
-    global player, inventory, game_msgs, game_state, distance_from_center, latitude, longitude, chunks
+    global player, inventory, game_msgs, game_state, latitude, longitude, chunks, lights, schedule
     
     #Create object representing player
     fighter_component = Fighter(hp = 30, defense = 2, power = 5, xp = 0, inventory = 0, death_function = player_death)
-    player = Object(25, 23, '@', 'player',  libtcod.black, blocks = True, fighter = fighter_component)
+    player = Object(CHUNK_WIDTH + 25, CHUNK_HEIGHT + 23, '@', 'player',  libtcod.black, blocks = True, fighter = fighter_component)
 
     player.level = 1
 
     latitude = 0
     longitude = 0
     chunks = []
+    lights = lighting.LightManager()
+    schedule = scheduling.Scheduler(actor_speed)
 
-    #Generate Map
-    distance_from_center = 0
-    make_forest()
+    #Generate the chunks around the player
+    load_region()
+    terrain_changed()
     initialize_fov()
 
     game_state = 'playing'
@@ -1244,6 +2036,8 @@ def new_game():
     #create the list of game messages and their colors, starts empty
     game_msgs = []
 
+    invalidate_panel()
+
     #Warm welcoming message!
     message('Welcome stranger!, Prepare to perish in the tombs of ancient kings!', libtcod.red)
 
@@ -1264,22 +2058,64 @@ def new_game():
     toque_component.equip()
 
 def initialize_fov():
-    global fov_recompute, fov_map
+    global fov_recompute, fov_map, fov_mask, fov_camera, dark_map, lit_map, memory_map, lit_from, transparent_cells
+    global path_map, paths, flow_field, flow_origin, flee_origin
     fov_recompute = True
 
+    #Visibility of every map cell from the last FOV computation, one bit per cell, see in_fov,
+    #and where the camera was then. Nothing has been seen on this map yet.
+    fov_mask = bytearray((MAP_WIDTH * MAP_HEIGHT + 7) // 8)
+    fov_camera = None
+    sight_cache.clear()
+
+    #Lay the tiles out in planes, one value per cell at x + y * MAP_WIDTH, going over each column once.
+    #Whether cells are transparent is kept, shadowcasting computes FOV from it.
+    transparent_cells = bytearray(MAP_WIDTH * MAP_HEIGHT)
+    walkable = bytearray(MAP_WIDTH * MAP_HEIGHT)
+    chars = [0] * (MAP_WIDTH * MAP_HEIGHT)
+    explored = []
+    for x in range(MAP_WIDTH):
+        column = map[x]
+        transparent_cells[x::MAP_WIDTH] = bytearray(not tile.block_sight for tile in column)
+        walkable[x::MAP_WIDTH] = bytearray(not tile.blocked for tile in column)
+        chars[x::MAP_WIDTH] = [ord(tile.char) for tile in column]
+        explored.extend((x, y) for (y, tile) in enumerate(column) if tile.explored)
+
     #Create the FOV map, according to the generated map
     fov_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.map_set_properties(fov_map, x, y, not map[x][y].block_sight, not map[x][y].blocked)
-    
-    libtcod.console_clear(con) #Unexplored areas start as black
+    libtcod.map_set_cells(fov_map, transparent_cells, walkable)
+
+    #Trees never move, so paths go around them as they do around walls
+    for obj in objects:
+        if obj.blocks and not obj.fighter:
+            walkable[obj.y * MAP_WIDTH + obj.x] = False
+    if path_map is not None:
+        paths.close()
+        libtcod.dijkstra_delete(flow_field)
+        libtcod.map_delete(path_map)
+    path_map = libtcod.map_new(MAP_WIDTH, MAP_HEIGHT)
+    libtcod.map_set_cells(path_map, transparent_cells, walkable)
+    paths = pathing.PathService(path_map)
+
+    #Distance to the player from every cell, and the flee map made from it, see player_distances
+    flow_field = libtcod.dijkstra_new(path_map)
+    flow_origin = None
+    flee_origin = None
+
+    #The whole map as it looks unexplored, black with the map glyphs barely visible
+    unexplored = libtcod.darker_grey
+    dark_map = libtcod.ConsoleBuffer(MAP_WIDTH, MAP_HEIGHT, 0, 0, 0, unexplored.r, unexplored.g, unexplored.b)
+    dark_map.set_chars(chars)
+
+    #The whole map as it looks lit, before the torch shades it: lit_map has the glyphs and the back
+    #color of cells in FOV, memory_map the back color of the ones remembered. Cells are only lit
+    #again when they come into or go out of sight, see relight_cell.
+    lit_map = dark_map.copy()
+    memory_map = libtcod.ConsoleBuffer(MAP_WIDTH, MAP_HEIGHT)
+    lit_from = None #Camera and player position the background was last composed from
+    for (x, y) in explored:
+        relight_cell(x, y)
 
-    for y in range(MAP_HEIGHT):
-        for x in range(MAP_WIDTH):
-            libtcod.console_set_char_background(con, x, y, libtcod.black)
-            libtcod.console_set_char_foreground(con, x, y, libtcod.darker_grey)
-            libtcod.console_set_char(con, x, y, map[x][y].char)
     
 def next_level():
     #Advance to next level
@@ -1289,6 +2125,8 @@ def next_level():
 
     message('You delve deeper into the dungeon.', libtcod.red)
     make_map() #Create a fresh new level
+    schedule.reset([obj for obj in objects if obj.ai])
+    terrain_changed()
     initialize_fov()
 
     dungeon_level += 1
@@ -1300,67 +2138,94 @@ def play_game():
 
     mouse = libtcod.Mouse()
     key = libtcod.Key()
-    while not libtcod.console_is_window_closed():
+    while not backend.console_is_window_closed():
         
-        libtcod.sys_check_for_event(libtcod.EVENT_KEY_RELEASE|libtcod.EVENT_MOUSE,key,mouse)
-        render_all()
+        profiler.start('input')
+        backend.sys_check_for_event(libtcod.EVENT_KEY_RELEASE|libtcod.EVENT_MOUSE,key,mouse)
+        profiler.stop('input')
 
-        libtcod.console_flush()
+        profiler.start('render')
+        render_all()
+        profiler.stop('render')
 
         #Level up if needed
+        profiler.start('level up')
         check_level_up()
-
-        for object in objects:
-            object.clear()
+        profiler.stop('level up')
 
         #Player turn
+        profiler.start('player turn')
         player_action = handle_keys()
+        profiler.stop('player turn')
+        if key.vk != libtcod.KEY_NONE:
+            world_changed() #Any handled key may have moved, picked up or dropped something
         if player_action == 'exit':
             save_game()
             break
 
         #Let mobs take their turn
         if game_state == 'playing' and player_action != 'didnt-take-turn':
-            for object in objects:
-                if object.ai:
-                    object.ai.take_turn()
+            profiler.start('ai turns')
+            take_mob_turns()
+            profiler.stop('ai turns')
+
+    #Let the last frame reach the screen before anything else draws
+    renderer.finish()
+
+def take_mob_turns():
+    #Every mob due before the player's next action takes its turn, the fast ones maybe twice
+    sight_cache.clear() #Only keep the viewpoints of a single turn around
+    until = schedule.time + schedule.delay(player)
+    actor = schedule.next(until)
+    while actor is not None:
+        if actor.ai:
+            actor.ai.take_turn()
+            schedule.done(actor) #Unless it died or left the map during its turn
+        actor = schedule.next(until)
+    lights.tick()
 
 def save_game():
     #Open a new empty shelve (possibly overwriting an old one) to write the game data
     file = shelve.open('savegame', 'n')
-    file['map'] = map
-    file['objects'] = objects
-    file['player_index'] = objects.index(player) #Index of player in object list
+    unload_region() #Hand the objects back to their chunks, the region is stitched again on load
+    file['chunks'] = chunks
+    file['player'] = player
+    file['latitude'] = latitude
+    file['longitude'] = longitude
     file['inventory'] = inventory
     file['game_msgs'] = game_msgs
     file['game_state'] = game_state
 #    file['stairs_index'] = objects.index(stairs) #Index of stairs in object list
-    file['distance_from_center'] = distance_from_center
     file.close()
 
 def load_game():
     #Open previously saved shelve and load game data
-    global map, objects, player, inventory, game_msgs, game_state, stairs, distance_from_center
+    global player, inventory, game_msgs, game_state, stairs, latitude, longitude, chunks, lights, schedule
 
     file = shelve.open('savegame', 'r')
-    map = file['map']
-    objects = file['objects']
-    player = objects[file['player_index']] #Get index of player in objects list and access it
+    chunks = file['chunks']
+    player = file['player']
+    latitude = file['latitude']
+    longitude = file['longitude']
     inventory = file['inventory']
     game_msgs = file['game_msgs']
     game_state = file['game_state']
 #    stairs = objects[file['stairs_index']] #Get index of stairs in objects list and access it
-    distance_from_center = file['distance_from_center']
     file.close()
+    lights = lighting.LightManager() #Burning ground is not saved, it will have gone out
+    schedule = scheduling.Scheduler(actor_speed)
 
+    load_region()
+    terrain_changed()
     initialize_fov()
+    invalidate_panel()
 
 def main_menu():
-    while not libtcod.console_is_window_closed():
+    while not backend.console_is_window_closed():
         #Show the games title and some credits
-        libtcod.console_set_default_foreground(0, libtcod.light_yellow)
-        libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT/2 - 4, libtcod.BKGND_NONE, libtcod.CENTER, 'Toque')
-        libtcod.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT - 2, libtcod.BKGND_NONE, libtcod.CENTER,'By Lenix')
+        backend.console_set_default_foreground(0, libtcod.light_yellow)
+        backend.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT/2 - 4, libtcod.BKGND_NONE, libtcod.CENTER, 'Toque')
+        backend.console_print_ex(0, SCREEN_WIDTH/2, SCREEN_HEIGHT - 2, libtcod.BKGND_NONE, libtcod.CENTER,'By Lenix')
         
         #Show the options and wait for the player's choice
         choice = menu('', ['New Game', 'Load', 'Quit'], 24)
@@ -1378,14 +2243,85 @@ def main_menu():
         elif choice == 2:
             break
 
+def replay_session(path):
+    #Play back a recorded session, left and right jump a keyframe back or forward, escape stops
+    session = recording.SessionPlayer(path)
+    screen = libtcod.ConsoleBuffer(session.width, session.height)
+    key = libtcod.Key()
+    mouse = libtcod.Mouse()
+    frame = 0
+    while frame < len(session) and not backend.console_is_window_closed():
+        session.seek(frame)
+        session.fill(screen)
+        backend.buffer_blit(screen, 0)
+        backend.console_flush()
+
+        backend.sys_check_for_event(libtcod.EVENT_KEY_PRESS, key, mouse)
+        if key.vk == libtcod.KEY_ESCAPE:
+            break
+        elif key.vk == libtcod.KEY_LEFT:
+            frame = session.keyframe_before(max(0, session.keyframe_before(frame) - 1))
+        elif key.vk == libtcod.KEY_RIGHT:
+            frame = session.keyframe_after(frame)
+        else:
+            frame += 1
+
 ##################################
 # Main Loop
 ##################################
 
-libtcod.console_set_custom_font('arial10x10.png', libtcod.FONT_TYPE_GREYSCALE | libtcod.FONT_LAYOUT_TCOD)
-libtcod.console_init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'Rogue', False)
-libtcod.sys_set_fps(LIMIT_FPS)
-con = libtcod.console_new(SCREEN_WIDTH, SCREEN_HEIGHT)
-panel = libtcod.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
-
-main_menu()
+def init_backend(new_backend):
+    #Open the root console and create the offscreen ones through the given render backend
+    global backend, con, background, entity_layer, effect_layer, frame_buffer, panel, menu_consoles
+    global animations, renderer, presented_background, presented_cells, panel_drawer, panel_buffer, panel_con
+    global recorder
+    backend = new_backend
+    backend.init_root(SCREEN_WIDTH, SCREEN_HEIGHT, 'Rogue', 'arial10x10.png', LIMIT_FPS)
+    con = backend.console_new(SCREEN_WIDTH, SCREEN_HEIGHT)
+
+    #The lit map is cached in the background layer and only rebuilt when FOV or terrain change,
+    #entities and effects go on their own layers and all are composited into the frame buffer every frame
+    background = libtcod.ConsoleBuffer(SCREEN_WIDTH, SCREEN_HEIGHT)
+    entity_layer = EntityLayer()
+    effect_layer = EntityLayer()
+    frame_buffer = libtcod.ConsoleBuffer(SCREEN_WIDTH, SCREEN_HEIGHT)
+    presented_background = None
+    presented_cells = []
+
+    #The widgets draw the panel in memory, on a console of a headless backend, so it goes to the
+    #screen (panel_con) and into recordings a whole buffer at a time and is never read back
+    panel_drawer = backends.HeadlessBackend()
+    panel = panel_drawer.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+    panel_buffer = panel_drawer.console(panel).buffer
+    panel_con = backend.console_new(SCREEN_WIDTH, PANEL_HEIGHT)
+
+    #Offscreen consoles for menus and message boxes, one per (width, height), reused between opens
+    menu_consoles = {}
+
+    #Effects are timed by the backend's clock
+    animations = animation.AnimationScheduler(backend.sys_elapsed_milli)
+
+    #Frames are drawn from snapshots, on a thread of their own if the backend allows it
+    renderer = rendering.RenderThread(present_frame, backend.render_thread)
+
+    #Session recording is off unless started with --record
+    recorder = None
+
+if __name__ == '__main__':
+    #"--backend headless" runs without opening a window (SDL is never initialized)
+    backend_name = 'sdl'
+    if '--backend' in sys.argv:
+        backend_name = sys.argv[sys.argv.index('--backend') + 1]
+
+    init_backend(backends.create_backend(backend_name))
+
+    #"--record FILE" records the session as it's played, "--replay FILE" plays one back instead
+    if '--replay' in sys.argv:
+        replay_session(sys.argv[sys.argv.index('--replay') + 1])
+    else:
+        if '--record' in sys.argv:
+            recorder = recording.SessionRecorder(sys.argv[sys.argv.index('--record') + 1], SCREEN_WIDTH, SCREEN_HEIGHT)
+        main_menu()
+        renderer.stop()
+        if recorder is not None:
+            recorder.close()
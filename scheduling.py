@@ -0,0 +1,74 @@
+import heapq
+import itertools
+
+##################################
+# Turn scheduling
+##################################
+#
+#Who acts next, as a priority queue of actors by the time their next action is due. An
+#action takes ACTION_COST divided by the actor's speed, so an actor twice as fast as
+#another acts twice as often. It is the same as giving every actor energy at its speed
+#and letting it act once it has saved up ACTION_COST, without handing energy out to every
+#actor each turn: only the actors that are due are ever looked at.
+#
+#Actors that are removed stay in the queue, marked as gone, and are dropped once they
+#come up, which is cheaper than taking them out of the middle of the heap.
+
+#Speed of an ordinary creature, which acts once per time unit
+NORMAL_SPEED = 100
+ACTION_COST = 100.0
+
+class Scheduler:
+    def __init__(self, speed):
+        self.speed = speed #Function giving an actor's speed
+        self.time = 0.0
+        self.queue = [] #[due time, order added, actor], the actor is None once removed
+        self.entries = {} #Actor's id: its entry in queue
+        self.order = itertools.count() #Actors due at the same time act in the order they were added
+        self.acting = None #The actor taken out by next, until it is done or removed
+
+    def delay(self, actor):
+        #Time until the actor's next action
+        return ACTION_COST / self.speed(actor)
+
+    def add(self, actor, due=None):
+        #Schedule the actor's next action after one of its actions from now, or at due
+        self.remove(actor)
+        entry = [self.time + self.delay(actor) if due is None else due, next(self.order), actor]
+        self.entries[id(actor)] = entry
+        heapq.heappush(self.queue, entry)
+
+    def remove(self, actor):
+        if actor is self.acting:
+            self.acting = None
+        entry = self.entries.pop(id(actor), None)
+        if entry is not None:
+            entry[2] = None
+
+    def done(self, actor):
+        #The actor taken out by next has acted, schedule its next action unless it was removed meanwhile
+        if actor is self.acting:
+            self.acting = None
+            self.add(actor)
+
+    def reset(self, actors):
+        #Schedule exactly these actors, the ones scheduled already keep their turn
+        entries = self.entries
+        self.entries = {}
+        self.queue = []
+        for actor in actors:
+            entry = entries.get(id(actor))
+            self.add(actor, entry[0] if entry is not None else None)
+
+    def next(self, until):
+        #Take the next actor due by until out of the queue, moving the time to when it is due. Once
+        #no actor is due, the time moves on to until and None is returned.
+        while self.queue and self.queue[0][0] <= until:
+            (due, order, actor) = heapq.heappop(self.queue)
+            if actor is not None:
+                del self.entries[id(actor)]
+                self.time = due
+                self.acting = actor
+                return actor
+        self.time = until
+        return None
@@ -0,0 +1,122 @@
+##################################
+# Recursive shadowcasting FOV
+##################################
+#
+#Field of view computed in Python, straight from a plane of the game's tiles instead of
+#a TCOD map. It is the same algorithm as libtcod's FOV_SHADOW (scanning each octant row
+#by row, recursing into the light that gets past each run of walls), so it sees exactly
+#the same cells, and returns them in the same form as libtcod.map_get_fov.
+#
+#Run this file to check it against libtcod on random maps and time both.
+
+#Pass as the FOV algorithm to use this module rather than one of libtcod's
+FOV_SHADOWCASTING = 'shadowcasting'
+
+#How each octant's (row, column) steps map onto x and y, as (xx, xy, yx, yy)
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+def compute_fov(transparent, width, height, x, y, radius=0, light_walls=True):
+    #FOV from (x, y) over a plane holding whether each cell is transparent, at x + y * width.
+    #Returns a bytearray with one bit per cell: the cell at i = x + y * width is in FOV if bit
+    #i & 7 of byte i >> 3 is set. A radius of 0 means no limit, as with libtcod.
+    if radius == 0:
+        radius = int((max(width - x, x) ** 2 + max(height - y, y) ** 2) ** 0.5) + 1
+    mask = bytearray((width * height + 7) // 8)
+    for (xx, xy, yx, yy) in OCTANTS:
+        cast_light(mask, transparent, width, height, x, y, 1, 1.0, 0.0, radius, light_walls, xx, xy, yx, yy)
+    i = x + y * width
+    mask[i >> 3] |= 1 << (i & 7)
+    return mask
+
+def cast_light(mask, transparent, width, height, cx, cy, row, start, end, radius, light_walls, xx, xy, yx, yy):
+    #Light the rows of an octant from row on, between the slopes start and end
+    if start < end:
+        return
+    r2 = radius * radius
+    new_start = 0.0
+    for j in range(row, radius + 1):
+        dy = -j
+        blocked = False
+        for dx in range(-j, 1):
+            x = cx + dx * xx + dy * xy
+            y = cy + dx * yx + dy * yy
+            if not (0 <= x < width and 0 <= y < height):
+                continue
+            i = x + y * width
+            l_slope = (dx - 0.5) / (dy + 0.5)
+            r_slope = (dx + 0.5) / (dy - 0.5)
+            if start < r_slope:
+                continue
+            elif end > l_slope:
+                break
+            if dx * dx + dy * dy <= r2 and (light_walls or transparent[i]):
+                mask[i >> 3] |= 1 << (i & 7)
+            if blocked:
+                if not transparent[i]:
+                    new_start = r_slope
+                else:
+                    blocked = False
+                    start = new_start
+            elif not transparent[i] and j < radius:
+                #A wall starts here, light what gets past it in the rows beyond, then carry on after it
+                blocked = True
+                cast_light(mask, transparent, width, height, cx, cy, j + 1, start, l_slope, radius, light_walls,
+                        xx, xy, yx, yy)
+                new_start = r_slope
+        if blocked:
+            break
+
+if __name__ == '__main__':
+    import random
+    import sys
+    import time
+    import libtcodpy as libtcod
+
+    def random_plane(width, height, walls):
+        return bytearray(random.random() >= walls for i in range(width * height))
+
+    def libtcod_fov(transparent, width, height, x, y, radius, light_walls, algo):
+        fov_map = libtcod.map_new(width, height)
+        libtcod.map_set_cells(fov_map, transparent, bytearray(width * height))
+        libtcod.map_compute_fov(fov_map, x, y, radius, light_walls, algo)
+        mask = libtcod.map_get_fov(fov_map)
+        libtcod.map_delete(fov_map)
+        return mask
+
+    def differences(a, b):
+        return sum(bin(p ^ q).count('1') for (p, q) in zip(a, b))
+
+    #Equivalence: every cell has to match libtcod's shadowcasting, the cells differing from
+    #FOV_BASIC (ray casting, a different algorithm) are only reported
+    (width, height) = (240, 129)
+    checks = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    (failed, basic) = (0, 0)
+    for n in range(checks):
+        transparent = random_plane(width, height, random.choice((0.05, 0.2, 0.4)))
+        (x, y) = (random.randrange(width), random.randrange(height))
+        radius = random.choice((0, 5, 20, 43))
+        light_walls = random.choice((True, False))
+        mask = compute_fov(transparent, width, height, x, y, radius, light_walls)
+        if mask != libtcod_fov(transparent, width, height, x, y, radius, light_walls, libtcod.FOV_SHADOW):
+            failed += 1
+        basic += differences(mask, libtcod_fov(transparent, width, height, x, y, radius, light_walls, libtcod.FOV_BASIC))
+    print('%d of %d random maps differ from FOV_SHADOW' % (failed, checks))
+    print('%.1f cells per map differ from FOV_BASIC on average' % (float(basic) / checks))
+
+    #Benchmark: a region sized map with the torch radius, from the middle
+    transparent = random_plane(width, height, 0.1)
+    (x, y, radius, runs) = (width // 2, height // 2, 43, 20)
+    start = time.time()
+    for n in range(runs):
+        compute_fov(transparent, width, height, x, y, radius, True)
+    python_ms = (time.time() - start) * 1000 / runs
+    fov_map = libtcod.map_new(width, height)
+    libtcod.map_set_cells(fov_map, transparent, bytearray(width * height))
+    for (name, algo) in (('FOV_BASIC', libtcod.FOV_BASIC), ('FOV_SHADOW', libtcod.FOV_SHADOW)):
+        start = time.time()
+        for n in range(runs):
+            libtcod.map_compute_fov(fov_map, x, y, radius, True, algo)
+            libtcod.map_get_fov(fov_map)
+        print('%-13s %.2f ms' % (name, (time.time() - start) * 1000 / runs))
+    print('%-13s %.2f ms' % ('shadowcasting', python_ms))
@@ -0,0 +1,97 @@
+import io
+import os
+import re
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import backends
+
+class TerminalInputTest(unittest.TestCase):
+    def setUp(self):
+        (read, self.write) = os.pipe()
+        self.input = os.fdopen(read, 'rb')
+        self.backend = backends.TerminalBackend(input=self.input)
+
+    def tearDown(self):
+        self.input.close()
+        os.close(self.write)
+
+    def send(self, data):
+        #Raw bytes, as the terminal sends them
+        os.write(self.write, data)
+
+    def keys(self):
+        #(vk, c) of every key event read until the input runs dry
+        key = libtcod.Key()
+        mouse = libtcod.Mouse()
+        keys = []
+        while True:
+            event = self.backend.next_event(key, mouse)
+            if event == libtcod.EVENT_NONE:
+                return keys
+            if event == libtcod.EVENT_KEY_PRESS:
+                keys.append((key.vk, key.c))
+
+    def test_characters(self):
+        self.send(b'gi')
+        self.assertEqual(self.keys(), [(libtcod.KEY_CHAR, ord('g')), (libtcod.KEY_CHAR, ord('i'))])
+
+    def test_parsed_characters(self):
+        self.backend.parse_input(b'd'.decode('utf-8'))
+        self.assertEqual(self.keys(), [(libtcod.KEY_CHAR, ord('d'))])
+
+    def test_arrows_and_escape(self):
+        self.send(b'\x1b[A\r\x1b')
+        self.assertEqual(self.keys(), [(libtcod.KEY_UP, 0), (libtcod.KEY_ENTER, 0), (libtcod.KEY_ESCAPE, 0)])
+
+    def test_unknown_sequences_are_dropped(self):
+        #Home, PgUp, F1 and F5, none of them may read as ESC
+        self.send(b'\x1b[H\x1b[5~\x1bOP\x1b[15~m')
+        self.assertEqual(self.keys(), [(libtcod.KEY_CHAR, ord('m'))])
+
+    def test_mouse(self):
+        self.send(b'\x1b[<0;5;7M')
+        key = libtcod.Key()
+        mouse = libtcod.Mouse()
+        self.assertEqual(self.backend.next_event(key, mouse), libtcod.EVENT_MOUSE)
+        self.assertEqual((mouse.cx, mouse.cy, mouse.lbutton_pressed), (4, 6, True))
+
+class TerminalOutputTest(unittest.TestCase):
+    def setUp(self):
+        (read, self.write) = os.pipe()
+        self.input = os.fdopen(read, 'rb')
+        self.output = io.BytesIO()
+        self.backend = backends.TerminalBackend(output=self.output, input=self.input)
+        self.backend.init_root(10, 2, 'test', None, 0)
+
+    def tearDown(self):
+        self.input.close()
+        os.close(self.write)
+
+    def screen(self):
+        #Play the output back on a bare terminal: the characters of the rows it drew, by position
+        screen = {}
+        (x, y) = (0, 0)
+        text = self.output.getvalue().decode('utf-8')
+        for token in re.findall(u'\x1b\\[[0-9;?]*[A-Za-z]|\x1b\\][^\x07]*\x07|.', text, re.S):
+            move = re.match(u'\x1b\\[(\\d+);(\\d+)H$', token)
+            if move:
+                (y, x) = (int(move.group(1)) - 1, int(move.group(2)) - 1)
+            elif token[0] >= u' ' and token != u'\x7f':
+                screen[(x, y)] = token
+                x += 1
+        return screen
+
+    def test_control_codes_are_drawn_as_glyphs(self):
+        #The world map draws forests and thickets with codes 6 and 5
+        for (x, c) in enumerate([ord('a'), 5, 6, ord('b'), 127, 1]):
+            self.backend.console_put_char(0, x, 0, c)
+        self.backend.console_flush()
+        screen = self.screen()
+        self.assertEqual([screen.get((x, 0)) for x in range(6)], [u'a', u'\u2663', u'\u2660', u'b', u'\u2302', u'\u263a'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import backends
+import rogue
+
+class FleeMapTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+        rogue.init_backend(backends.HeadlessBackend())
+        rogue.new_game()
+
+        #Open ground all around the player, but for a wall just east of them
+        (px, py) = (rogue.player.x, rogue.player.y)
+        near = lambda x, y: abs(x - px) <= rogue.FLEE_RADIUS + 2 and abs(y - py) <= rogue.FLEE_RADIUS + 2
+        rogue.objects[:] = [obj for obj in rogue.objects if obj is rogue.player or not near(obj.x, obj.y)]
+        for x in range(px - rogue.FLEE_RADIUS - 2, px + rogue.FLEE_RADIUS + 3):
+            for y in range(py - rogue.FLEE_RADIUS - 2, py + rogue.FLEE_RADIUS + 3):
+                tile = rogue.map[x][y]
+                tile.blocked = tile.block_sight = (x == px + 4 and abs(y - py) <= 3)
+        rogue.terrain_changed()
+        rogue.initialize_fov()
+
+    def test_no_cell_is_safer_than_the_way_out_of_it(self):
+        safety = rogue.flee_map()
+        field = rogue.player_distances()
+        (px, py) = (rogue.player.x, rogue.player.y)
+        self.assertNotIn((px + 4, py), safety) #The wall
+        self.assertNotIn((px + rogue.FLEE_RADIUS + 1, py), safety)
+        for ((x, y), value) in safety.items():
+            self.assertTrue(max(abs(x - px), abs(y - py)) <= rogue.FLEE_RADIUS)
+            self.assertTrue(value <= libtcod.dijkstra_get_distance(field, x, y) * rogue.FLEE_FACTOR + 1e-6)
+            for (dx, dy) in rogue.NEIGHBORS:
+                neighbor = safety.get((x + dx, y + dy))
+                if neighbor is not None:
+                    self.assertTrue(value <= neighbor + (1.41 if dx and dy else 1.0) + 1e-6)
+
+        #Shared until the player moves
+        self.assertIs(rogue.flee_map(), safety)
+        rogue.player.x -= 1
+        self.assertIsNot(rogue.flee_map(), safety)
+
+    def test_flee_around_a_wall(self):
+        #Running straight away from the player would leave the mob stuck against the wall
+        (px, py) = (rogue.player.x, rogue.player.y)
+        mob = rogue.Object(px + 3, py, 's', 'squirrel', libtcod.sepia, blocks=True)
+        rogue.objects.append(mob)
+        for turn in range(8):
+            self.assertTrue(rogue.step_away_from_player(mob))
+        self.assertTrue(mob.distance_to(rogue.player) > 6)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+
+#An odd size, so the last byte of the FOV bits is only partly used
+(WIDTH, HEIGHT) = (37, 23)
+
+class BulkMapTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+        rng = random.Random(3)
+        self.transparent = [rng.random() < 0.8 for i in range(WIDTH * HEIGHT)]
+        self.walkable = [rng.random() < 0.7 for i in range(WIDTH * HEIGHT)]
+
+        #The same map set up cell by cell
+        self.reference = libtcod.map_new(WIDTH, HEIGHT)
+        for y in range(HEIGHT):
+            for x in range(WIDTH):
+                i = y * WIDTH + x
+                libtcod.map_set_properties(self.reference, x, y, self.transparent[i], self.walkable[i])
+        self.numpy_available = libtcod.numpy_available
+
+    def tearDown(self):
+        libtcod.numpy_available = self.numpy_available
+        libtcod.map_delete(self.reference)
+
+    def check_set_cells(self):
+        m = libtcod.map_new(WIDTH, HEIGHT)
+        libtcod.map_set_cells(m, bytearray(self.transparent), bytearray(self.walkable))
+        for y in range(HEIGHT):
+            for x in range(WIDTH):
+                self.assertEqual(libtcod.map_is_transparent(m, x, y), libtcod.map_is_transparent(self.reference, x, y))
+                self.assertEqual(libtcod.map_is_walkable(m, x, y), libtcod.map_is_walkable(self.reference, x, y))
+        self.assertRaises(ValueError, libtcod.map_set_cells, m, self.transparent[1:], self.walkable)
+        libtcod.map_delete(m)
+
+    def test_set_cells(self):
+        self.check_set_cells()
+
+    def test_set_cells_without_numpy(self):
+        libtcod.numpy_available = False
+        self.check_set_cells()
+
+    def test_fov_matches_map_is_in_fov(self):
+        for (x, y) in [(0, 0), (18, 11), (WIDTH - 1, HEIGHT - 1)]:
+            libtcod.map_compute_fov(self.reference, x, y, 10, True, libtcod.FOV_BASIC)
+            fov = libtcod.map_get_fov(self.reference)
+            self.assertEqual(len(fov), (WIDTH * HEIGHT + 7) // 8)
+            for cy in range(HEIGHT):
+                for cx in range(WIDTH):
+                    i = cy * WIDTH + cx
+                    self.assertEqual(bool(fov[i >> 3] & (1 << (i & 7))), libtcod.map_is_in_fov(self.reference, cx, cy))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import backends
+import lighting
+import rogue
+
+class IncrementalLightingTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+        rogue.init_backend(backends.HeadlessBackend())
+        rogue.new_game()
+        rogue.player.fighter.hp = rogue.player.fighter.base_max_hp = 10 ** 6
+        (rogue.key, rogue.mouse) = (libtcod.Key(), libtcod.Mouse()) #Set up by play_game otherwise
+        rogue.render_all()
+        rogue.renderer.finish()
+
+    def planes(self, buffer):
+        return [list(getattr(buffer, plane)[:rogue.CAMERA_WIDTH * rogue.CAMERA_HEIGHT])
+                for plane in buffer._planes]
+
+    def test_steps_match_a_full_relight(self):
+        for (dx, dy) in [(1, 0)] * 12 + [(0, 1)] * 8 + [(-1, -1)] * 10:
+            rogue.player_move_or_attack(dx, dy)
+            rogue.render_all()
+        background = rogue.background
+
+        #Light every cell on the map again from scratch
+        for y in range(rogue.MAP_HEIGHT):
+            for x in range(rogue.MAP_WIDTH):
+                rogue.relight_cell(x, y)
+        self.assertEqual(self.planes(background), self.planes(rogue.compose_background()))
+
+    def test_light_without_moving_only_draws_its_cells(self):
+        background = rogue.background
+        rogue.lights.add(lighting.Light(3, libtcod.flame, 0.5, rogue.player.x + 2, rogue.player.y + 1))
+        rogue.render_all()
+        rogue.renderer.finish()
+        self.assertIsNot(rogue.background, background)
+        self.assertEqual(self.planes(rogue.background), self.planes(rogue.compose_background()))
+
+        #Only the changed cells were copied, the frame must still show the whole background
+        covered = set(rogue.presented_cells)
+        for plane in rogue.frame_buffer._planes:
+            (frame, lit) = (getattr(rogue.frame_buffer, plane), getattr(rogue.background, plane))
+            for i in range(rogue.CAMERA_WIDTH * rogue.CAMERA_HEIGHT):
+                if (i % rogue.SCREEN_WIDTH, i // rogue.SCREEN_WIDTH) not in covered:
+                    self.assertEqual(frame[i], lit[i])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import pathing
+
+(WIDTH, HEIGHT) = (20, 10)
+
+class PathServiceTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+
+        #An open field with a wall down the middle, open at the bottom
+        self.map = libtcod.map_new(WIDTH, HEIGHT)
+        libtcod.map_clear(self.map, True, True)
+        for y in range(HEIGHT - 2):
+            libtcod.map_set_properties(self.map, 10, y, False, False)
+        self.paths = pathing.PathService(self.map)
+
+        #Count the paths actually computed
+        self.computed = []
+        compute = self.paths.compute
+        def counted(start, goal):
+            self.computed.append((start, goal))
+            return compute(start, goal)
+        self.paths.compute = counted
+
+    def tearDown(self):
+        self.paths.close()
+        libtcod.map_delete(self.map)
+
+    def test_cached_along_the_path(self):
+        steps = self.paths.find((2, 2), (17, 2), 0)
+        self.assertEqual(steps[-1], (17, 2))
+        self.assertTrue(all(y >= HEIGHT - 2 for (x, y) in steps if x == 10)) #Around the wall
+        for (i, cell) in enumerate(steps[:-1]):
+            self.assertEqual(self.paths.find(cell, (17, 2), 0), steps[i + 1:])
+        self.assertEqual(self.computed, [((2, 2), (17, 2))])
+        self.assertEqual(len(self.paths.pool), 1)
+
+        #A new version of the terrain doesn't use it
+        self.paths.find((2, 2), (17, 2), 1)
+        self.assertEqual(len(self.computed), 2)
+
+    def test_goal_moving_nearby_extends_the_path(self):
+        steps = self.paths.find((2, 2), (17, 2), 0)
+        moved = self.paths.find(steps[3], (18, 3), 0)
+        self.assertEqual(moved[:-1], steps[4:])
+        self.assertEqual(moved[-1], (18, 3))
+        self.assertEqual(self.computed[-1], ((17, 2), (18, 3)))
+
+    def test_detour_around_a_walker(self):
+        (start, goal) = ((2, 4), (8, 4))
+        steps = self.paths.find(start, goal, 0)
+        walker = steps[1]
+        step = self.paths.next_step(start, goal, 0, lambda x, y: (x, y) == walker)
+        self.assertIsNotNone(step)
+        self.assertNotEqual(step, walker)
+
+        #The rest of the way, now kept for the cell stepped into, goes around the walker too
+        rest = self.paths.find(step, goal, 0)
+        self.assertEqual(rest[-1], goal)
+        self.assertNotIn(walker, rest)
+        self.assertTrue(libtcod.map_is_walkable(self.map, walker[0], walker[1])) #Only out of the map for the detour
+
+    def test_detour_when_walled_in(self):
+        #Walkers all around, there is no way through
+        start = (0, 0)
+        blocked = set([(1, 0), (0, 1), (1, 1)])
+        self.assertIsNone(self.paths.next_step(start, (5, 0), 0, lambda x, y: (x, y) in blocked))
+
+if __name__ == '__main__':
+    unittest.main()
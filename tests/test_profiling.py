@@ -0,0 +1,41 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import profiling
+
+class FrameProfilerTest(unittest.TestCase):
+    def test_stats(self):
+        profiler = profiling.FrameProfiler()
+        profiler.start('ignored') #Disabled, nothing is kept
+        profiler.stop('ignored')
+        profiler.toggle()
+        for n in range(3):
+            profiler.start('render')
+            profiler.stop('render')
+        self.assertEqual([phase for (phase, mean, p95, worst) in profiler.stats()], ['render'])
+
+    def test_stats_while_another_thread_times(self):
+        #The render thread times its own phases while the game thread reads the stats
+        profiler = profiling.FrameProfiler(window=16)
+        profiler.toggle()
+        errors = []
+        def render():
+            try:
+                for n in range(20000):
+                    profiler.start('flush')
+                    profiler.stop('flush')
+            except Exception as e:
+                errors.append(e)
+        thread = threading.Thread(target=render)
+        thread.start()
+        while thread.is_alive():
+            profiler.stats()
+        thread.join()
+        self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+    unittest.main()
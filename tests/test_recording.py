@@ -0,0 +1,64 @@
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import recording
+
+(WIDTH, HEIGHT) = (12, 5)
+
+class SessionRecordingTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'session.rec')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def planes(self, buffer):
+        return [list(getattr(buffer, name)) for name in recording.PLANES]
+
+    def record(self, count, keyframe_interval):
+        #Record count frames of a few random cells changing, returns the planes of each frame
+        rng = random.Random(7)
+        buffer = libtcod.ConsoleBuffer(WIDTH, HEIGHT)
+        recorder = recording.SessionRecorder(self.path, WIDTH, HEIGHT, keyframe_interval)
+        frames = []
+        for frame in range(count):
+            changed = []
+            for n in range(rng.randint(0, 6)):
+                (x, y) = (rng.randrange(WIDTH), rng.randrange(HEIGHT))
+                buffer.set(x, y, rng.randrange(256), rng.randrange(256), rng.randrange(256),
+                        rng.randrange(256), rng.randrange(256), rng.randrange(256), chr(rng.randrange(32, 127)))
+                changed.append(y * WIDTH + x)
+            recorder.record(frame * 40, buffer, None if frame == 0 else changed)
+            frames.append(self.planes(buffer))
+        recorder.close()
+        return frames
+
+    def test_round_trip(self):
+        frames = self.record(30, 10)
+        player = recording.SessionPlayer(self.path)
+        self.assertEqual(len(player), 30)
+        self.assertEqual(player.keyframes, [0, 11, 22])
+        for (frame, planes) in enumerate(frames):
+            self.assertEqual(player.seek(frame), frame * 40)
+            self.assertEqual([list(plane) for plane in player.planes], planes)
+
+    def test_seek(self):
+        frames = self.record(30, 10)
+        player = recording.SessionPlayer(self.path)
+        #Backwards, across keyframes and within the stretch after one
+        for frame in [29, 3, 17, 12, 12, 0, 25, 21]:
+            player.seek(frame)
+            buffer = libtcod.ConsoleBuffer(WIDTH, HEIGHT)
+            player.fill(buffer)
+            self.assertEqual(self.planes(buffer), frames[frame])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import backends
+import rogue
+
+class RegionTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+        rogue.init_backend(backends.HeadlessBackend())
+        rogue.new_game()
+
+    def where(self):
+        #Every object but the player, by the chunk it is in and its place in that chunk
+        return dict((id(obj), (rogue.longitude + obj.x // rogue.CHUNK_WIDTH - rogue.REGION_CHUNKS // 2,
+                rogue.latitude + obj.y // rogue.CHUNK_HEIGHT - rogue.REGION_CHUNKS // 2,
+                obj.x % rogue.CHUNK_WIDTH, obj.y % rogue.CHUNK_HEIGHT))
+                for obj in rogue.objects if obj is not rogue.player)
+
+    def test_chunks_are_stitched_around_the_player(self):
+        self.assertEqual((len(rogue.map), len(rogue.map[0])), (rogue.MAP_WIDTH, rogue.MAP_HEIGHT))
+        for cy in range(rogue.REGION_CHUNKS):
+            for cx in range(rogue.REGION_CHUNKS):
+                chunk = rogue.get_chunk(cx - 1, cy - 1)
+                self.assertEqual(chunk.objects, []) #Handed over to the region
+                for (x, y) in [(0, 0), (5, 17), (rogue.CHUNK_WIDTH - 1, rogue.CHUNK_HEIGHT - 1)]:
+                    self.assertIs(rogue.map[cx * rogue.CHUNK_WIDTH + x][cy * rogue.CHUNK_HEIGHT + y], chunk.map[x][y])
+        self.assertEqual(len(rogue.chunks), rogue.REGION_CHUNKS ** 2)
+
+    def test_recenter_on_the_chunk_walked_into(self):
+        where = self.where()
+        (x, y) = (rogue.player.x, rogue.player.y)
+        rogue.recenter_region()
+        self.assertEqual((rogue.longitude, rogue.latitude, rogue.player.x, rogue.player.y), (0, 0, x, y))
+
+        #Into the chunk to the south east
+        rogue.player.x += rogue.CHUNK_WIDTH
+        rogue.player.y += rogue.CHUNK_HEIGHT
+        rogue.recenter_region()
+        self.assertEqual((rogue.longitude, rogue.latitude, rogue.player.x, rogue.player.y), (1, 1, x, y))
+        self.assertEqual(len(rogue.chunks), 14)
+        self.assertIs(rogue.map[rogue.CHUNK_WIDTH][rogue.CHUNK_HEIGHT], rogue.get_chunk(1, 1).map[0][0])
+
+        #The objects of the chunks still loaded stayed where they were, the others went back to their chunk
+        now = self.where()
+        for (key, place) in where.items():
+            if place[0] >= 0 and place[1] >= 0:
+                self.assertEqual(now[key], place)
+            else:
+                self.assertNotIn(key, now)
+        chunk = rogue.get_chunk(-1, -1)
+        self.assertNotEqual(chunk.objects, [])
+        self.assertTrue(all((where[id(obj)][2:] == (obj.x, obj.y)) for obj in chunk.objects))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import libtcodpy as libtcod
+import backends
+import rogue
+import scheduling
+
+class Actor:
+    def __init__(self, speed):
+        self.speed = speed
+
+class SchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.schedule = scheduling.Scheduler(lambda actor: actor.speed)
+
+    def run_until(self, until):
+        #Every actor taking its turns, in order, until then
+        acted = []
+        actor = self.schedule.next(until)
+        while actor is not None:
+            acted.append(actor)
+            self.schedule.done(actor)
+            actor = self.schedule.next(until)
+        return acted
+
+    def test_speeds(self):
+        (slow, fast) = (Actor(scheduling.NORMAL_SPEED), Actor(scheduling.NORMAL_SPEED * 2))
+        self.schedule.reset([slow, fast])
+        acted = self.run_until(10)
+        self.assertEqual((acted.count(slow), acted.count(fast)), (10, 20))
+
+    def test_removed_while_acting(self):
+        actor = Actor(scheduling.NORMAL_SPEED)
+        self.schedule.add(actor)
+        self.assertIs(self.schedule.next(1), actor)
+        self.schedule.remove(actor)
+        self.schedule.done(actor)
+        self.assertEqual(self.run_until(10), [])
+
+class Westward:
+    #Walks west, off the map once it gets to the edge
+    def take_turn(self):
+        self.owner.move(-1, 0)
+
+class MobTurnsTest(unittest.TestCase):
+    def setUp(self):
+        #libtcodpy only sets up the C prototypes on Mac, pointers are truncated on 64-bit without them
+        from libtcodpy.cprotos import setup_protos
+        setup_protos(libtcod._lib)
+        rogue.init_backend(backends.HeadlessBackend())
+        rogue.new_game()
+
+    def test_mob_leaving_the_map(self):
+        y = rogue.player.y
+        for x in range(2):
+            rogue.map[x][y].blocked = False
+            for obj in list(rogue.objects):
+                if (obj.x, obj.y) == (x, y) and obj is not rogue.player:
+                    rogue.objects.remove(obj)
+        mob = rogue.Object(1, y, 'B', 'brown bear', libtcod.red, blocks=True,
+                fighter=rogue.Fighter(hp=16, defense=10, power=15, xp=100), ai=Westward())
+        rogue.objects.append(mob)
+        summary = rogue.chunk_summary_at(1, y)
+        summary.count(mob, 1)
+        mobs = summary.mobs
+        rogue.schedule.add(mob)
+
+        for turn in range(4):
+            rogue.take_mob_turns()
+        self.assertNotIn(mob, rogue.objects)
+        self.assertNotIn(id(mob), rogue.schedule.entries)
+        self.assertEqual(summary.mobs, mobs - 1)
+
+if __name__ == '__main__':
+    unittest.main()